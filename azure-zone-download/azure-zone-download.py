@@ -25,174 +25,248 @@ SOFTWARE.
 """
 
 import argparse
-import csv
-import getpass
+import collections
 import os
 import sys
-import re
 
-from azure.common.credentials import ServicePrincipalCredentials
-from azure.mgmt.dns import DnsManagementClient
-from msrestazure.azure_exceptions import CloudError
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
+from dnstools import azuredns, metrics, zonecache
+from dnstools.azuredns import call_with_backoff, check_zone_names_unique, create_dns_client, deserialize_record_set, get_resource_group, list_record_sets, list_zones, serialize_record_set
+from dnstools.console import bcolors, get_counted_lines, print_error, print_section
+from dnstools.csvcodec import replace_on_success, write_records, write_zone_files
+from dnstools.names import get_absolute_name, normalize_zone_name, qualify_name
+from dnstools.records import Record
 
-class bcolors:
-    HEADER = '\033[95m'
-    OKBLUE = '\033[94m'
-    OKGREEN = '\033[92m'
-    WARNING = '\033[93m'
-    FAIL = '\033[91m'
-    ENDC = '\033[0m'
-    BOLD = '\033[1m'
-    UNDERLINE = '\033[4m'
 
+def quote_txt_string(value):
+    # Character strings of TXT records are written as in zone files
+    return "\"%s\"" % value.replace("\\", "\\\\").replace("\"", "\\\"")
 
-def print_error(msg):
-    sys.stderr.write(bcolors.FAIL + bcolors.BOLD + "Error:" + bcolors.ENDC + " %s\n" % msg)
 
+def get_referenced_name(ref_name, record_type, dns_name, zone_name, warnings):
+    if not ref_name.endswith("."):
+        warnings["Name %s referenced by %s record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS." % (ref_name, record_type, dns_name)] += 1
 
-def main():
+    return qualify_name(ref_name, zone_name)
+
+
+def get_records(record_set, zone_name, warnings):
+    records = []
+
+    dns_name = get_absolute_name(record_set.name, zone_name)
+    ttl = record_set.ttl
+
+    if record_set.arecords is not None:
+        for arecord in record_set.arecords:
+            records.append(Record(dns_name, ttl, "A", arecord.ipv4_address))
+
+    if record_set.aaaa_records is not None:
+        for aaaa_record in record_set.aaaa_records:
+            records.append(Record(dns_name, ttl, "AAAA", aaaa_record.ipv6_address))
+
+    if record_set.mx_records is not None:
+        for mx_record in record_set.mx_records:
+            exchange = get_referenced_name(mx_record.exchange, "MX", dns_name, zone_name, warnings)
+            records.append(Record(dns_name, ttl, "MX", "%d %s" % (mx_record.preference, exchange)))
+
+    if record_set.ns_records is not None:
+        for ns_record in record_set.ns_records:
+            records.append(Record(dns_name, ttl, "NS", get_referenced_name(ns_record.nsdname, "NS", dns_name, zone_name, warnings)))
+
+    if record_set.ptr_records is not None:
+        for ptr_record in record_set.ptr_records:
+            records.append(Record(dns_name, ttl, "PTR", get_referenced_name(ptr_record.ptrdname, "PTR", dns_name, zone_name, warnings)))
+
+    if record_set.srv_records is not None:
+        for srv_record in record_set.srv_records:
+            target = get_referenced_name(srv_record.target, "SRV", dns_name, zone_name, warnings)
+            records.append(Record(dns_name, ttl, "SRV", "%d %d %d %s" % (srv_record.priority, srv_record.weight, srv_record.port, target)))
+
+    if record_set.txt_records is not None:
+        for txt_record in record_set.txt_records:
+            records.append(Record(dns_name, ttl, "TXT", " ".join([ quote_txt_string(x) for x in txt_record.value ])))
+
+    if record_set.cname_record is not None:
+        records.append(Record(dns_name, ttl, "CNAME", get_referenced_name(record_set.cname_record.cname, "CNAME", dns_name, zone_name, warnings)))
+
+    if record_set.soa_record is not None:
+        host          = get_referenced_name(record_set.soa_record.host, "SOA", dns_name, zone_name, warnings)
+        email         = record_set.soa_record.email
+        serial_number = record_set.soa_record.serial_number
+        refresh_time  = record_set.soa_record.refresh_time
+        retry_time    = record_set.soa_record.retry_time
+        expire_time   = record_set.soa_record.expire_time
+        minimum_ttl   = record_set.soa_record.minimum_ttl
+
+        data = "%s %s %d %d %d %d %d" % (host, email, serial_number, refresh_time, retry_time, expire_time, minimum_ttl)
+        records.append(Record(dns_name, ttl, "SOA", data))
+
+    if record_set.caa_records is not None:
+        for caa_record in record_set.caa_records:
+            records.append(Record(dns_name, ttl, "CAA", "%d %s %s" % (caa_record.flags, caa_record.tag, quote_txt_string(caa_record.value))))
+
+    return records
+
+
+def get_zone_records(record_sets, zone_name, warnings):
+    for record_set in record_sets:
+        records = get_records(record_set, zone_name, warnings)
+        metrics.count("records", len(records))
+
+        for record in records:
+            yield record
+
+
+def cache_record_sets(record_sets, serialized_record_sets):
+    # Keep the record sets passing by for the cache
+    for record_set in record_sets:
+        serialized_record_sets.append(serialize_record_set(record_set))
+        yield record_set
+
+
+def download_zone(dns_client, resource_group, zone_name, csv_filename, cache=None, zone=None):
+    # Warnings are counted instead of repeated
+    warnings = collections.Counter()
+
+    cached_record_sets = None
+    if cache is not None:
+        cached_record_sets = cache.get(resource_group, zone_name, zone.etag, zone.number_of_record_sets)
+
+    serialized_record_sets = []
+    if cached_record_sets is not None:
+        record_sets = [ deserialize_record_set(dns_client, x) for x in cached_record_sets ]
+    else:
+        # Record sets are requested page by page while the CSV file is written
+        record_sets = list_record_sets(dns_client, resource_group, zone_name)
+        if cache is not None:
+            record_sets = cache_record_sets(record_sets, serialized_record_sets)
+
+    with metrics.phase("downloading"):
+        write_records(csv_filename, get_zone_records(record_sets, zone_name, warnings))
+
+    if cache is not None and cached_record_sets is None:
+        cache.put(resource_group, zone_name, zone.etag, zone.number_of_record_sets, serialized_record_sets)
+
+    return warnings
+
+
+def download_zone_to_file(dns_client, resource_group, zone_name, csv_filename, cache=None, zone=None):
+    # The CSV file of an earlier run is only replaced once the zone is
+    # downloaded completely
+    try:
+        with replace_on_success(csv_filename) as temp_csv_filename:
+            return (download_zone(dns_client, resource_group, zone_name, temp_csv_filename, cache, zone), None)
+    except (azuredns.CloudError, azuredns.ClientRequestError, EnvironmentError) as e:
+        metrics.count("errors")
+        return (collections.Counter(), "Download of zone %s failed: %s" % (zone_name, e))
+
+
+def download_zones(dns_client, zones, csv_filename, output_dir, workers, cache=None, zone_objects=None):
+    if zone_objects is None:
+        zone_objects = {}
+
+    zones_downloaded = []
+    warnings = collections.Counter()
+    errors = []
+
+    # All zones are downloaded over the same client
+    def download(zone, zone_csv_filename):
+        (resource_group, zone_name) = zone
+        return download_zone_to_file(dns_client, resource_group, zone_name, zone_csv_filename, cache, zone_objects.get(zone))
+
+    results = write_zone_files(zones, [ zone_name for (resource_group, zone_name) in zones ], csv_filename, output_dir, workers, download)
+
+    for ((resource_group, zone_name), (zone_warnings, error)) in zip(zones, results):
+        warnings.update(zone_warnings)
+        if error is not None:
+            errors.append(error)
+        else:
+            zones_downloaded.append(zone_name)
+
+    return (zones_downloaded, warnings, errors)
+
+
+def main(argv=None, prog=None):
     # Parse arguments
-    parser = argparse.ArgumentParser(description="Tool to download DNS zones from Azure.", add_help=True)
+    parser = argparse.ArgumentParser(prog=prog, description="Tool to download DNS zones from Azure.", add_help=True)
     parser.add_argument("--tenant-id", type=str, required=False, help="Azure tenant ID.")
     parser.add_argument("--subscription-id", type=str, required=False, help="Azure subscription ID.")
-    parser.add_argument("--resource-group", type=str, required=True, help="Azure resource group of the DNS zone.")
+    parser.add_argument("--resource-group", type=str, required=False, help="Azure resource group of the DNS zone. Together with --all-zones: download only the zones of this resource group.")
     parser.add_argument("--client-id", type=str, required=False, help="Client ID of service principal.")
-    parser.add_argument("--zone", type=str, required=True, help="Name of the DNS zone to dump.")
-    parser.add_argument("--csv-file", type=str, required=True, help="CSV file name to write the records to.")
-    args = parser.parse_args()
-
-    if "AZURE_SUBSCRIPTION_ID" in os.environ:
-        subscription_id = os.environ['AZURE_SUBSCRIPTION_ID']
-    elif args.subscription_id is not None:
-        subscription_id = args.subscription_id
-    else:
-        print_error("AZURE_SUBSCRIPTION_ID is a required parameter.")
-        sys.exit(1)
+    zone_group = parser.add_mutually_exclusive_group(required=True)
+    zone_group.add_argument("--zone", type=str, help="Name of the DNS zone to dump.")
+    zone_group.add_argument("--all-zones", action="store_true", help="Dump all DNS zones of the resource group or, without --resource-group, of the subscription.")
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument("--csv-file", type=str, help="CSV file name to write the records to.")
+    output_group.add_argument("--output-dir", type=str, help="Together with --all-zones: directory to write one CSV file per zone to.")
+    parser.add_argument("--workers", type=int, default=8, help="Together with --all-zones: number of zones downloaded concurrently (default: 8).")
+    azuredns.add_arguments(parser)
+    zonecache.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
 
-    if "AZURE_CLIENT_ID" in os.environ:
-        client_id = os.environ['AZURE_CLIENT_ID']
-    elif args.client_id is not None:
-        client_id = args.client_id
-    else:
-        print_error("AZURE_CLIENT_ID is a required parameter.")
+    metrics.setup(args)
+
+    if args.zone is not None and args.resource_group is None:
+        print_error("--resource-group is required together with --zone.")
         sys.exit(1)
 
-    if "AZURE_CLIENT_SECRET" in os.environ:
-        client_secret = os.environ['AZURE_CLIENT_SECRET']
-    else:
-        client_secret = getpass.getpass("client-secret: ")
+    if args.output_dir is not None and not args.all_zones:
+        print_error("--output-dir can only be used together with --all-zones.")
+        sys.exit(1)
 
-    if "AZURE_TENANT_ID" in os.environ:
-        tenant_id = os.environ['AZURE_TENANT_ID']
-    elif args.tenant_id is not None:
-        tenant_id = args.tenant_id
-    else:
-        print_error("AZURE_TENANT_ID is a required parameter.")
+    if args.workers < 1:
+        print_error("--workers must be at least 1.")
         sys.exit(1)
 
-    # Make sure that zone name does not start with "." nor ends with "."
-    zone_name = args.zone
-    if zone_name.startswith("."):
-        zone_name = re.sub(r"^\.", r"", zone_name)
-    
-    if zone_name.endswith("."):
-        zone_name = re.sub(r"\.$", r"", zone_name)
+    dns_client = create_dns_client(args)
+    cache = zonecache.open_cache(args)
 
-    warnings = []
+    if args.zone is not None:
+        zone_name = normalize_zone_name(args.zone)
 
-    credentials = ServicePrincipalCredentials(client_id=client_id, secret=client_secret, tenant=tenant_id)
-    dns_client = DnsManagementClient(credentials, subscription_id)
+        # Check if zone exists
+        try:
+            zone = call_with_backoff(dns_client.zones.get, args.resource_group, zone_name)
+        except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+            print(e)
+            sys.exit(1)
 
-    # Check if zone exists
-    try:
-        zone = dns_client.zones.get(args.resource_group, zone_name)
-    except CloudError as e:
-        print(e)
-        sys.exit(1)
+        try:
+            with replace_on_success(args.csv_file) as temp_csv_filename:
+                warnings = download_zone(dns_client, args.resource_group, zone_name, temp_csv_filename, cache, zone)
+        except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+            print(e)
+            sys.exit(1)
+
+        metrics.finish_progress()
+        print_section("Warnings:", bcolors.WARNING, get_counted_lines(warnings))
+        return
 
+    # Discover the zones
     try:
-        record_sets = dns_client.record_sets.list_all_by_dns_zone(args.resource_group, zone_name)
-    except CloudError as e:
+        zone_objects = dict([ ((get_resource_group(zone), zone.name), zone) for zone in list_zones(dns_client, args.resource_group) ])
+    except (azuredns.CloudError, azuredns.ClientRequestError) as e:
         print(e)
         sys.exit(1)
 
-    f = open(args.csv_file, "w")
-    
-    for record_set in record_sets:
-        if record_set.name == "@":
-            dns_name = zone_name
-        else:
-            dns_name = "%s.%s" % (record_set.name, zone_name)
-        
-        if record_set.arecords is not None:
-            for arecord in record_set.arecords:
-                csv_row = "%s;%s;A;%s\n" % (dns_name, record_set.ttl, arecord.ipv4_address)
-                f.write(csv_row)
-        
-        if record_set.aaaa_records is not None:
-            for aaaa_record in record_set.aaaa_records:
-                csv_row = "%s;%s;AAAA;%s\n" % (dns_name, record_set.ttl, aaaa_record.ipv6_address)
-                f.write(csv_row)
-        
-        if record_set.mx_records is not None:
-            warnings.append("MX records exist in the zone but MX records are not supported by this tool. Hence this record types are missing in the CSV file.")
-        
-        if record_set.ns_records is not None:
-            for ns_record in record_set.ns_records:
-                ref_name = ns_record.nsdname
-                if not ref_name.endswith("."):
-                    warnings.append("Name %s referenced by NS record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS." % (ref_name, dns_name))
-                    ref_name = "%s.%s." % (ref_name, zone_name)
-                
-                csv_row = "%s;%s;NS;%s\n" % (dns_name, record_set.ttl, ref_name)
-                f.write(csv_row)
-        
-        if record_set.ptr_records is not None:
-            warnings.append("PTR records exist in the zone but PTR records are not supported by this tool. Hence this record types are missing in the CSV file.")
-        
-        if record_set.srv_records is not None:
-            warnings.append("SRV records exist in the zone but SRV records are not supported by this tool. Hence this record types are missing in the CSV file.")
-        
-        if record_set.txt_records is not None:
-            warnings.append("TXT records exist in the zone but TXT records are not supported by this tool. Hence this record types are missing in the CSV file.")
-        
-        if record_set.cname_record is not None:
-            ref_name = record_set.cname_record.cname
-            if not ref_name.endswith("."):
-                warnings.append("Name %s referenced by CNAME record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS." % (ref_name, dns_name))
-                ref_name = "%s.%s." % (ref_name, zone_name)
-
-            csv_row = "%s;%s;CNAME;%s\n" % (dns_name, record_set.ttl, ref_name)
-            f.write(csv_row)
-        
-        if record_set.soa_record is not None:
-            host          = record_set.soa_record.host
-            email         = record_set.soa_record.email
-            serial_number = record_set.soa_record.serial_number
-            refresh_time  = record_set.soa_record.refresh_time
-            retry_time    = record_set.soa_record.retry_time
-            expire_time   = record_set.soa_record.expire_time
-            minimum_ttl   = record_set.soa_record.minimum_ttl
-
-            if not host.endswith("."):
-                warnings.append("Name %s referenced by SOA record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS." % (host, dns_name))
-                host = "%s.%s." % (host, zone_name)
-            
-            data = "%s %s %d %d %d %d %d" % (host, email, serial_number, refresh_time, retry_time, expire_time, minimum_ttl)
-            csv_row = "%s;%s;SOA;%s\n" % (dns_name, record_set.ttl, data)
-            f.write(csv_row)
-
-        if record_set.caa_records is not None:
-            warnings.append("CAA records exist in the zone but CAA records are not supported by this tool. Hence this record types are missing in the CSV file.")
-    
-    f.close()
-
-    if len(warnings) > 0:
-        print("")
-        print(bcolors.WARNING + bcolors.BOLD + "Warnings:" + bcolors.ENDC)
-        for line in warnings:
-            print(line)
+    zones = sorted(zone_objects, key=lambda x: x[1])
+
+    if args.output_dir is not None:
+        # Zones with the same name in different resource groups would be
+        # written to the same file.
+        check_zone_names_unique(zones)
+
+    (zones_downloaded, warnings, errors) = download_zones(dns_client, zones, args.csv_file, args.output_dir, args.workers, cache, zone_objects)
+
+    metrics.finish_progress()
+    print_section("Zones successfully downloaded:", bcolors.OKGREEN, zones_downloaded)
+    print_section("Warnings:", bcolors.WARNING, get_counted_lines(warnings))
+    print_section("Errors:", bcolors.FAIL, errors)
+
+    if len(errors) > 0:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -25,297 +25,528 @@ SOFTWARE.
 """
 
 import argparse
-import csv
-import getpass
 import os
-import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from azure.common.credentials import ServicePrincipalCredentials
-from azure.mgmt.dns import DnsManagementClient
-from msrestazure.azure_exceptions import CloudError
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
+from dnstools import azuredns, metrics, zonecache
+from dnstools.azuredns import BATCH_MAX_REQUESTS, call_with_backoff, check_zone_names_unique, create_dns_client, create_record_set_request, deserialize_record_set, get_record_set_type, get_resource_group, list_record_sets, list_zones, send_batch, serialize_record_set
+from dnstools.checkpoint import Checkpoint
+from dnstools.console import bcolors, print_error, print_section
+from dnstools.csvcodec import read_record_groups
+from dnstools.names import find_zone, get_relative_name, normalize_zone_name, qualify_name
+from dnstools.records import RecordSet, group_record_sets
+from dnstools.validation import validate_zone_dicts
 
-class bcolors:
-    HEADER = '\033[95m'
-    OKBLUE = '\033[94m'
-    OKGREEN = '\033[92m'
-    WARNING = '\033[93m'
-    FAIL = '\033[91m'
-    ENDC = '\033[0m'
-    BOLD = '\033[1m'
-    UNDERLINE = '\033[4m'
 
+RECORD_TYPES_SUPPORTED = [ "A", "AAAA", "CNAME" ]
 
-def print_error(msg):
-    sys.stderr.write(bcolors.FAIL + bcolors.BOLD + "Error:" + bcolors.ENDC + " %s\n" % msg)
 
+def create_zone_dicts_from_csv_file(csv_filename, zone_names, workers=1):
+    # Keep only records matching one of the zones. Every name is assigned to
+    # the most specific zone it belongs to in a single pass over the file.
+    # Names outside of the zones are counted.
+    zone_names = set(zone_names)
+    zone_dicts = dict([ (x, {}) for x in zone_names ])
+    names_outside = set([])
 
-def create_zone_dict_from_csv_file(csv_filename):
-    f = open(csv_filename, "r")
-    lines = f.readlines()
-    f.close()
+    for (dns_name, records) in read_record_groups(csv_filename, workers):
+        zone_name = find_zone(dns_name, zone_names)
+        if zone_name is None:
+            names_outside.add(dns_name)
+            continue
 
-    lines = [ x.rstrip() for x in lines ]
+        zone_dict = zone_dicts[zone_name]
+        if dns_name in zone_dict:
+            zone_dict[dns_name].extend(records)
+        else:
+            zone_dict[dns_name] = records
+
+    return (zone_dicts, len(names_outside))
+
+
+def read_zone_dicts(args, zone_names):
+    # Read the zones from the CSV file and check all of their records. An
+    # invalid CSV file fails the run before anything is written.
+    with metrics.phase("parsing"):
+        (zone_dicts, names_outside) = create_zone_dicts_from_csv_file(args.csv_file, zone_names, args.parse_workers)
+
+    with metrics.phase("validating"):
+        (warnings, errors) = validate_zone_dicts(zone_dicts, RECORD_TYPES_SUPPORTED)
+
+    if names_outside > 0:
+        warnings.insert(0, "Records of %d name(s) in CSV file outside of the zones %s are ignored." % (names_outside, ", ".join(sorted(zone_names))))
 
-    zone_dict = {}
-    for line in lines:
-        x = line.split(';')
+    if errors != [] or args.validate_only:
+        metrics.count("errors", len(errors))
+        metrics.finish_progress()
+        print_section("Warnings:", bcolors.WARNING, warnings)
+        print_section("Errors:", bcolors.FAIL, errors)
 
-        if len(x) != 4:
-            print_error("Invalid CSV provided!")
+        if errors != []:
+            print_error("CSV file is invalid. No record sets were written.")
             sys.exit(1)
 
-        dns_name = x[0]
-        ttl = x[1]
-        rtype = x[2]
-        data = x[3]
+        sys.exit(0)
 
-        if dns_name in zone_dict:
-            zone_dict[dns_name].append({"ttl": ttl, "type": rtype, "data": data})
+    return (zone_dicts, warnings)
+
+
+def get_record_set_values(record_set):
+    if record_set.arecords is not None:
+        return [ x.ipv4_address for x in record_set.arecords ]
+
+    if record_set.aaaa_records is not None:
+        return [ x.ipv6_address for x in record_set.aaaa_records ]
+
+    if record_set.cname_record is not None:
+        return [ record_set.cname_record.cname ]
+
+    return []
+
+
+def create_record_set_parameters(record_set):
+    if record_set.type == "A":
+        return { "ttl": record_set.ttl, "arecords": [ { "ipv4_address": x } for x in record_set.data ] }
+
+    if record_set.type == "AAAA":
+        return { "ttl": record_set.ttl, "aaaarecords": [ { "ipv6_address": x } for x in record_set.data ] }
+
+    return { "ttl": record_set.ttl, "cname_record": { "cname": record_set.data[0] } }
+
+
+def get_existing_record_sets(dns_client, resource_group, zone_name, cache=None, zone=None, sync=False):
+    # List the whole zone once and keep an index of all record sets by
+    # (name, type). Names are compared case-insensitively like in DNS. With
+    # a cache, the ETags of the record sets are returned as well, so that
+    # writes can be made conditional on them.
+    existing_record_sets = {}
+    etags = None
+
+    # Edited record sets keep the ETag and the number of record sets of the
+    # zone. --sync compares the records, so the zone is always listed and
+    # the listing refreshes the cache.
+    cached_record_sets = None
+    if cache is not None:
+        etags = {}
+        if not sync:
+            cached_record_sets = cache.get(resource_group, zone_name, zone.etag, zone.number_of_record_sets)
+
+    if cached_record_sets is not None:
+        record_sets = [ deserialize_record_set(dns_client, x) for x in cached_record_sets ]
+    else:
+        record_sets = list_record_sets(dns_client, resource_group, zone_name)
+        if cache is not None:
+            record_sets = list(record_sets)
+            cache.put(resource_group, zone_name, zone.etag, zone.number_of_record_sets, [ serialize_record_set(x) for x in record_sets ])
+
+    for record_set in record_sets:
+        record_type = get_record_set_type(record_set)
+        existing_record_sets[(record_set.name.lower(), record_type)] = RecordSet(record_set.name, record_type, record_set.ttl, get_record_set_values(record_set))
+        if etags is not None:
+            etags[(record_set.name.lower(), record_type)] = record_set.etag
+
+    return (existing_record_sets, etags)
+
+
+def is_record_set_changed(existing_record_set, record_set):
+    if existing_record_set.ttl != record_set.ttl:
+        return True
+
+    return sorted([ x.lower() for x in existing_record_set.data ]) != sorted([ x.lower() for x in record_set.data ])
+
+
+def get_record_set_writes(zone_name, existing_record_sets, sync, dns_name, records):
+    # Decide which record sets of a name have to be written. A write is a
+    # tuple (name, record set, parameters, create).
+    writes = []
+    warnings = []
+
+    name = get_relative_name(dns_name, zone_name)
+
+    record_sets = {}
+    for record_set in group_record_sets(records):
+        record_sets[record_set.type] = record_set
+
+    # Azure DNS seems to not support relative names. The records have been
+    # validated before, see validate_zone_dicts.
+    if "CNAME" in record_sets:
+        record_sets["CNAME"].data = [ qualify_name(x, zone_name) for x in record_sets["CNAME"].data ]
+
+    for record_type in RECORD_TYPES_SUPPORTED:
+        if record_type not in record_sets:
+            continue
+
+        record_set = record_sets[record_type]
+        parameters = create_record_set_parameters(record_set)
+        existing_record_set = existing_record_sets.get((name.lower(), record_type))
+
+        if existing_record_set is None:
+            writes.append((name, record_set, parameters, True))
+
+        elif not sync:
+            warnings.append("Record set %s for name %s already exists. Skipping record set." % (record_type, name))
+
+        elif is_record_set_changed(existing_record_set, record_set):
+            # Replace record set with the records of the CSV file
+            writes.append((name, record_set, parameters, False))
+
+    return (writes, warnings)
+
+
+def get_write_result(write, failed):
+    (name, record_set, parameters, create) = write
+
+    metrics.count("records", len(record_set.data))
+    if failed:
+        metrics.count("errors")
+
+    lines = [ "%s;%s;%s;%s" % (name, record_set.ttl, record_set.type, x) for x in record_set.data ]
+
+    if create:
+        if failed:
+            return (lines, [], [ "Error while creating record set %s for name %s." % (record_set.type, name) ])
+
+        return (lines, [], [])
+
+    if failed:
+        return ([], [], [ "Error while updating record set %s for name %s." % (record_set.type, name) ])
+
+    return ([], lines, [])
+
+
+def commit_write(checkpoint, zone_name, write, result):
+    (name, record_set, parameters, create) = write
+    (write_records_created, write_records_updated, write_errors) = result
+
+    if create:
+        checkpoint.commit("created", zone_name, name, record_set.type, write_records_created)
+    else:
+        checkpoint.commit("updated", zone_name, name, record_set.type, write_records_updated)
+
+
+def get_write_conditions(name, record_type, create, etags):
+    # Record sets known from the cache are only written if they did not
+    # change in the meantime. Without a cache they were just listed.
+    if etags is None:
+        return {}
+
+    if create:
+        return { "if_none_match": "*" }
+
+    return { "if_match": etags[(name.lower(), record_type)] }
+
+
+def get_precondition_error(record_type, name):
+    metrics.count("errors")
+    return "Record set %s for name %s was changed since the zone was cached. Record set skipped. Rerun with --cache-invalidate." % (record_type, name)
+
+
+def put_record_set(dns_client, resource_group, zone_name, write, checkpoint=None, etags=None):
+    (name, record_set, parameters, create) = write
+
+    try:
+        call_with_backoff(dns_client.record_sets.create_or_update, resource_group, zone_name, name, record_set.type, parameters, write=True, **get_write_conditions(name, record_set.type, create, etags))
+    except azuredns.CloudError as e:
+        if e.status_code == 412:
+            metrics.count("records", len(record_set.data))
+            return ([], [], [ get_precondition_error(record_set.type, name) ])
+
+        return get_write_result(write, True)
+    except azuredns.ClientRequestError as e:
+        return get_write_result(write, True)
+
+    result = get_write_result(write, False)
+    if checkpoint is not None:
+        commit_write(checkpoint, zone_name, write, result)
+
+    return result
+
+
+def put_record_sets_batch(dns_client, resource_group, zone_name, writes, checkpoint=None):
+    records_created = []
+    records_updated = []
+    errors = []
+
+    requests = [ create_record_set_request(dns_client, resource_group, zone_name, name, record_set.type, parameters) for (name, record_set, parameters, create) in writes ]
+
+    try:
+        status_codes = send_batch(dns_client, requests)
+    except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+        # Fall back to individual requests for the whole batch
+        status_codes = [ None ] * len(writes)
+
+    for (write, status_code) in zip(writes, status_codes):
+        if status_code in [ 200, 201 ]:
+            result = get_write_result(write, False)
+            if checkpoint is not None:
+                commit_write(checkpoint, zone_name, write, result)
         else:
-            zone_dict[dns_name] = [ {"ttl": ttl, "type": rtype, "data": data} ]
+            result = put_record_set(dns_client, resource_group, zone_name, write, checkpoint)
+
+        (write_records_created, write_records_updated, write_errors) = result
+
+        records_created.extend(write_records_created)
+        records_updated.extend(write_records_updated)
+        errors.extend(write_errors)
+
+    return (records_created, records_updated, errors)
+
+
+def delete_record_set(dns_client, resource_group, zone_name, existing_record_set, checkpoint=None, etags=None):
+    name = existing_record_set.name
+    record_type = existing_record_set.type
+
+    metrics.count("records", len(existing_record_set.data))
+
+    try:
+        call_with_backoff(dns_client.record_sets.delete, resource_group, zone_name, name, record_type, write=True, **get_write_conditions(name, record_type, False, etags))
+    except azuredns.CloudError as e:
+        if e.status_code == 412:
+            return ([], [ get_precondition_error(record_type, name) ])
+
+        metrics.count("errors")
+        return ([], [ "Error while deleting record set %s for name %s." % (record_type, name) ])
+    except azuredns.ClientRequestError as e:
+        metrics.count("errors")
+        return ([], [ "Error while deleting record set %s for name %s." % (record_type, name) ])
+
+    lines = [ "%s;%s;%s;%s" % (name, existing_record_set.ttl, record_type, x) for x in existing_record_set.data ]
+    if checkpoint is not None:
+        checkpoint.commit("deleted", zone_name, name, record_type, lines)
+
+    return (lines, [])
+
 
-    return zone_dict
+def get_stale_record_sets(zone_name, zone_dict, existing_record_sets):
+    # Record sets of supported types which exist in the zone but not in the
+    # CSV file.
+    record_sets_in_csv = set([])
+    for dns_name in zone_dict:
+        name = get_relative_name(dns_name, zone_name)
+        for record in zone_dict[dns_name]:
+            record_sets_in_csv.add((name.lower(), record.type))
 
+    return [ existing_record_sets[x] for x in sorted(existing_record_sets) if x[1] in RECORD_TYPES_SUPPORTED and x not in record_sets_in_csv ]
 
-def main():
+
+def main(argv=None, prog=None):
     # Parse arguments
-    parser = argparse.ArgumentParser(description="Tool to upload DNS records to Azure DNS zones.", add_help=True)
+    parser = argparse.ArgumentParser(prog=prog, description="Tool to upload DNS records to Azure DNS zones.", add_help=True)
     parser.add_argument("--tenant-id", type=str, required=False, help="Azure tenant ID.")
     parser.add_argument("--subscription-id", type=str, required=False, help="Azure subscription ID.")
-    parser.add_argument("--resource-group", type=str, required=True, help="Azure resource group of the DNS zone.")
+    parser.add_argument("--resource-group", type=str, required=False, help="Azure resource group of the DNS zones. Together with --all-zones: upload only to the zones of this resource group.")
     parser.add_argument("--client-id", type=str, required=False, help="Client ID of service principal.")
-    parser.add_argument("--zone", type=str, required=True, help="Name of the DNS zone to create records in.")
+    zone_group = parser.add_mutually_exclusive_group(required=True)
+    zone_group.add_argument("--zone", type=str, nargs="+", help="Name(s) of the DNS zone(s) to create records in.")
+    zone_group.add_argument("--all-zones", action="store_true", help="Create records in all DNS zones of the resource group or, without --resource-group, of the subscription.")
     parser.add_argument("--csv-file", type=str, required=True, help="CSV file with DNS records to be created.")
-    args = parser.parse_args()
-
-    if "AZURE_SUBSCRIPTION_ID" in os.environ:
-        subscription_id = os.environ['AZURE_SUBSCRIPTION_ID']
-    elif args.subscription_id is not None:
-        subscription_id = args.subscription_id
-    else:
-        print_error("AZURE_SUBSCRIPTION_ID is a required parameter.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of record sets to upload concurrently (default: 1).")
+    parser.add_argument("--parse-workers", type=int, default=1, help="Number of processes parsing large CSV files (default: 1).")
+    parser.add_argument("--batch-size", type=int, default=0, help="Number of record sets written with one Azure Resource Manager batch request, at most %d (default: 0, no batching)." % BATCH_MAX_REQUESTS)
+    parser.add_argument("--sync", action="store_true", help="Update changed and delete stale A, AAAA and CNAME record sets so that the zone matches the CSV file.")
+    parser.add_argument("--validate-only", action="store_true", help="Only check the records of the CSV file and exit. Together with --zone no requests are sent to Azure.")
+    parser.add_argument("--checkpoint-file", type=str, help="Journal of the record sets written. A run restarted with the same journal skips them. The journal is removed after a run without errors.")
+    azuredns.add_arguments(parser)
+    zonecache.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    metrics.setup(args)
+
+    if args.zone is not None and args.resource_group is None:
+        print_error("--resource-group is required together with --zone.")
         sys.exit(1)
 
-    if "AZURE_CLIENT_ID" in os.environ:
-        client_id = os.environ['AZURE_CLIENT_ID']
-    elif args.client_id is not None:
-        client_id = args.client_id
-    else:
-        print_error("AZURE_CLIENT_ID is a required parameter.")
+    if args.workers < 1:
+        print_error("--workers must be at least 1.")
         sys.exit(1)
 
-    if "AZURE_CLIENT_SECRET" in os.environ:
-        client_secret = os.environ['AZURE_CLIENT_SECRET']
-    else:
-        client_secret = getpass.getpass("client-secret: ")
+    if args.parse_workers < 1:
+        print_error("--parse-workers must be at least 1.")
+        sys.exit(1)
 
-    if "AZURE_TENANT_ID" in os.environ:
-        tenant_id = os.environ['AZURE_TENANT_ID']
-    elif args.tenant_id is not None:
-        tenant_id = args.tenant_id
-    else:
-        print_error("AZURE_TENANT_ID is a required parameter.")
+    if args.batch_size < 0 or args.batch_size > BATCH_MAX_REQUESTS:
+        print_error("--batch-size must be between 0 and %d." % BATCH_MAX_REQUESTS)
         sys.exit(1)
 
-    # Make sure that zone name does not start with "." nor ends with "."
-    zone_name = args.zone
-    if zone_name.startswith("."):
-        zone_name = re.sub(r"^\.", r"", zone_name)
-    
-    if zone_name.endswith("."):
-        zone_name = re.sub(r"\.$", r"", zone_name)
+    # Batch requests cannot be made conditional on the ETags of the cache
+    if args.cache_file is not None and args.batch_size > 0:
+        print_error("--cache-file cannot be used together with --batch-size.")
+        sys.exit(1)
 
-    warnings = []
-    errors = []
-    records_created = []
+    # With --zone the zones are known, so the CSV file is read and checked
+    # before any request is sent
+    zone_dicts = None
+    if args.zone is not None:
+        (zone_dicts, warnings) = read_zone_dicts(args, set([ normalize_zone_name(x) for x in args.zone ]))
 
+    dns_client = create_dns_client(args)
+    cache = zonecache.open_cache(args)
+    zone_objects = {}
 
-    credentials = ServicePrincipalCredentials(client_id=client_id, secret=client_secret, tenant=tenant_id)
-    dns_client = DnsManagementClient(credentials, subscription_id)
+    if args.zone is not None:
+        zones = [ (args.resource_group, normalize_zone_name(x)) for x in args.zone ]
 
-    # Check if zone exists
-    try:
-        dns_client.zones.get(args.resource_group, zone_name)
-    except CloudError as e:
-        print(e)
-        sys.exit(1)
-    
-    # Read zone from CSV file and create dict
-    zone_dict = create_zone_dict_from_csv_file(args.csv_file)
-
-    dns_names_sorted = zone_dict.keys()
-
-    # Filter records in CSV file. Keep only those matching zone postfix.
-    dns_names_filtered = []
-    for dns_name in dns_names_sorted:
-        m = re.search(r"(^|\.)%s$" % zone_name, dns_name)
-        if m is not None:
-            dns_names_filtered.append(dns_name)
-    dns_names_sorted = dns_names_filtered
-
-    # Sort names
-    dns_names_sorted.sort()
-
-    # Check record types in CSV file
-    record_types_in_zone = set([])
-    for dns_name in dns_names_sorted:
-        records = zone_dict[dns_name]
-        for record in records:
-            record_types_in_zone.add(record["type"])
-    
-    record_types_supported = [ "A", "AAAA", "CNAME" ]
-
-    for record_type in record_types_in_zone:
-        if record_type not in record_types_supported:
-            warnings.append("Record(s) of type %s in CSV file which is currently not supported by the tool. Please handle records manually." % record_type)
-
-    # Update Azure zone
-    for dns_name in dns_names_sorted:
-        name = re.sub(r"(^|\.)%s$" % zone_name, r"", dns_name)
-        if name == "":
-            name = "@"
-
-        a_record_set = { "ttl": 0, "data": [] }
-        aaaa_record_set = { "ttl": 0, "data": [] }
-        cname_record_set = { "ttl": 0, "data": [] }
-
-        records = zone_dict[dns_name]
-        for record in records:
-            if record["type"] == "A":
-                # Assumption: TTL is the same for each entry of a DNS record set.
-                # Thus, we take the last occurence.
-                a_record_set["ttl"] = record["ttl"]
-                a_record_set["data"].append(record["data"])
-
-            elif record["type"] == "AAAA":
-                # Assumption: TTL is the same for each entry of a DNS record set.
-                # Thus, we take the last occurence.
-                aaaa_record_set["ttl"] = record["ttl"]
-                aaaa_record_set["data"].append(record["data"])
-
-            elif record["type"] == "CNAME":
-                # Assumption: TTL is the same for each entry of a DNS record set.
-                # Thus, we take the last occurence.
-                cname_record_set["ttl"] = record["ttl"]
-
-                ref_name = record["data"]
-                # Azure DNS seems to not support relative names
-                if not ref_name.endswith("."):
-                    ref_name_old = ref_name
-                    ref_name = "%s.%s." % (ref_name, zone_name)
-                    warnings.append("Name %s referenced by CNAME record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS. Hence, zone name was added to the name: %s" % (ref_name_old, name, ref_name))
-                
-                cname_record_set["data"].append(ref_name)
-            
-        if a_record_set["data"] != []:
-            data = [ { "ipv4_address": x } for x in a_record_set["data"] ]
-
-            record_set = {
-                "ttl": a_record_set["ttl"],
-                "arecords": data
-            }
-
-            # Get record to check if it is already existing
-            record_exists = False
+        # Check if zones exist
+        for (resource_group, zone_name) in zones:
             try:
-                dns_client.record_sets.get(args.resource_group, zone_name, name, "A")
-                record_exists = True
-            except CloudError as e:
-                pass
-            
-            # Create record
-            if record_exists == False:
-                try:
-                    dns_client.record_sets.create_or_update(args.resource_group, zone_name, name, "A", record_set)
-                except CloudError as e:
-                    errors.append("Error while creating record set A for name %s." % name)
+                zone_objects[(resource_group, zone_name)] = call_with_backoff(dns_client.zones.get, resource_group, zone_name)
+            except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+                print(e)
+                sys.exit(1)
 
-                for x in a_record_set["data"]:
-                    records_created.append("%s;%s;A;%s" % (name, a_record_set["ttl"], x))
-            else:
-                warnings.append("Record set A for name %s already exists. Skipping record set." % name)
-        
+    else:
+        # Discover the zones
+        try:
+            zone_objects = dict([ ((get_resource_group(zone), zone.name), zone) for zone in list_zones(dns_client, args.resource_group) ])
+        except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+            print(e)
+            sys.exit(1)
 
-        if aaaa_record_set["data"] != []:
-            data = [ { "ipv6_address": x } for x in aaaa_record_set["data"] ]
+    zones = sorted(zone_objects, key=lambda x: x[1])
+    zone_names = [ zone_name for (resource_group, zone_name) in zones ]
 
-            record_set = {
-                "ttl": aaaa_record_set["ttl"],
-                "aaaarecords": data
-            }
+    if zone_names == []:
+        print_error("No DNS zones found.")
+        sys.exit(1)
 
-            # Get record to check if it is already existing
-            record_exists = False
-            try:
-                dns_client.record_sets.get(args.resource_group, zone_name, name, "AAAA")
-                record_exists = True
-            except CloudError as e:
-                pass
-            
-            # Create record
-            if record_exists == False:
+    # Records are routed to zones by name
+    check_zone_names_unique(zones)
+
+    if zone_dicts is None:
+        (zone_dicts, warnings) = read_zone_dicts(args, zone_names)
+
+    zone_warnings = {}
+    zone_errors = {}
+    records_created = {}
+    records_updated = {}
+    records_deleted = {}
+    for zone_name in zone_names:
+        zone_warnings[zone_name] = []
+        zone_errors[zone_name] = []
+        records_created[zone_name] = []
+        records_updated[zone_name] = []
+        records_deleted[zone_name] = []
+
+    if args.all_zones:
+        # Discovered zones without records in the CSV file are left alone,
+        # so that --sync does not empty them.
+        zones = [ (resource_group, zone_name) for (resource_group, zone_name) in zones if zone_dicts[zone_name] != {} ]
+        zone_names = [ zone_name for (resource_group, zone_name) in zones ]
+
+    checkpoint = None
+    if args.checkpoint_file is not None:
+        checkpoint = Checkpoint(args.checkpoint_file)
+
+    # All zones are updated through the same client and workers
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # Get record sets already existing in the zones
+        futures = [ executor.submit(get_existing_record_sets, dns_client, resource_group, zone_name, cache, zone_objects[(resource_group, zone_name)], args.sync) for (resource_group, zone_name) in zones ]
+
+        existing_record_sets = {}
+        etags = {}
+        with metrics.phase("fetching"):
+            for ((resource_group, zone_name), future) in zip(zones, futures):
                 try:
-                    dns_client.record_sets.create_or_update(args.resource_group, zone_name, name, "AAAA", record_set)
-                except CloudError as e:
-                    errors.append("Error while creating record set AAAA for name %s." % name)
-
-                for x in aaaa_record_set["data"]:
-                    records_created.append("%s;%s;AAAA;%s" % (name, aaaa_record_set["ttl"], x))
+                    (existing_record_sets[zone_name], etags[zone_name]) = future.result()
+                except (azuredns.CloudError, azuredns.ClientRequestError) as e:
+                    print(e)
+                    sys.exit(1)
+
+        # Decide which record sets to delete and to write. This needs no
+        # requests.
+        with metrics.phase("diffing"):
+            stale_record_sets = {}
+            writes = {}
+            for zone_name in zone_names:
+                # Record sets written by a previous run with the same
+                # checkpoint file are reported again but not touched.
+                committed = {}
+                if checkpoint is not None:
+                    committed = checkpoint.get_record_sets(zone_name)
+
+                for key in sorted(committed):
+                    (action, lines) = committed[key]
+                    if action == "created":
+                        records_created[zone_name].extend(lines)
+                    elif action == "updated":
+                        records_updated[zone_name].extend(lines)
+                    else:
+                        records_deleted[zone_name].extend(lines)
+
+                zone_record_sets = existing_record_sets[zone_name]
+                if committed != {}:
+                    zone_record_sets = dict([ (k, v) for (k, v) in zone_record_sets.items() if k not in committed ])
+
+                stale_record_sets[zone_name] = []
+                if args.sync:
+                    stale_record_sets[zone_name] = get_stale_record_sets(zone_name, zone_dicts[zone_name], zone_record_sets)
+
+                writes[zone_name] = []
+                for dns_name in sorted(zone_dicts[zone_name]):
+                    (name_writes, name_warnings) = get_record_set_writes(zone_name, zone_record_sets, args.sync, dns_name, zone_dicts[zone_name][dns_name])
+                    writes[zone_name].extend([ x for x in name_writes if (x[0].lower(), x[1].type) not in committed ])
+                    zone_warnings[zone_name].extend(name_warnings)
+
+        with metrics.phase("writing"):
+            # Stale record sets are deleted first, so that e.g. a stale CNAME
+            # record set does not conflict with new records.
+            tasks = [ (zone_name, executor.submit(delete_record_set, dns_client, resource_group, zone_name, x, checkpoint, etags[zone_name])) for (resource_group, zone_name) in zones for x in stale_record_sets[zone_name] ]
+
+            for (zone_name, future) in tasks:
+                (name_records_deleted, name_errors) = future.result()
+                records_deleted[zone_name].extend(name_records_deleted)
+                zone_errors[zone_name].extend(name_errors)
+
+            if args.batch_size > 0:
+                # Several record sets are written with one ARM batch request
+                tasks = [ (zone_name, executor.submit(put_record_sets_batch, dns_client, resource_group, zone_name, writes[zone_name][i:i + args.batch_size], checkpoint)) for (resource_group, zone_name) in zones for i in range(0, len(writes[zone_name]), args.batch_size) ]
             else:
-                warnings.append("Record set AAAA for name %s already exists. Skipping record set." % name)
-        
-
-        if cname_record_set["data"] != []:
-            if len(cname_record_set["data"]) > 1:
-                errors.append("More than one alias in CNAME record set for name %s. This is not valid! Record set skipped." % name)
-            else:
-                record_set = {
-                    "ttl": cname_record_set["ttl"],
-                    "cname_record": {
-                        "cname": cname_record_set["data"][0]
-                    }
-                }
-
-                # Get record to check if it is already existing
-                record_exists = False
-                try:
-                    dns_client.record_sets.get(args.resource_group, zone_name, name, "CNAME")
-                    record_exists = True
-                except CloudError as e:
-                    pass
-                
-                # Create record
-                if record_exists == False:
-                    try:
-                        dns_client.record_sets.create_or_update(args.resource_group, zone_name, name, "CNAME", record_set)
-                    except CloudError as e:
-                        errors.append("Error while creating record set CNAME for name %s." % name)
-
-                    records_created.append("%s;%s;CNAME;%s" % (name, cname_record_set["ttl"], cname_record_set["data"][0]))
-                else:
-                    warnings.append("Record set CNAME for name %s already exists. Skipping record set." % name)
+                tasks = [ (zone_name, executor.submit(put_record_set, dns_client, resource_group, zone_name, x, checkpoint, etags[zone_name])) for (resource_group, zone_name) in zones for x in writes[zone_name] ]
+
+            # Collect results in the order of the zones and sorted names
+            for (zone_name, future) in tasks:
+                (write_records_created, write_records_updated, write_errors) = future.result()
+                records_created[zone_name].extend(write_records_created)
+                records_updated[zone_name].extend(write_records_updated)
+                zone_errors[zone_name].extend(write_errors)
+
+    if cache is not None:
+        # The cached record sets of zones written to are outdated
+        for (resource_group, zone_name) in zones:
+            if stale_record_sets[zone_name] != [] or writes[zone_name] != []:
+                cache.invalidate(resource_group, zone_name)
+
+    if checkpoint is not None:
+        # Nothing is left to resume after a run without errors
+        if any([ zone_errors[x] != [] for x in zone_names ]):
+            checkpoint.close()
+        else:
+            checkpoint.remove()
 
     # Output
-    if len(records_created) > 0:
-        print("")
-        print(bcolors.OKGREEN + bcolors.BOLD + "Record sets successfully created:" + bcolors.ENDC)
-        for line in records_created:
-            print(line)
-
-    if len(warnings) > 0:
-        print("")
-        print(bcolors.WARNING + bcolors.BOLD + "Warnings:" + bcolors.ENDC)
-        for line in warnings:
-            print(line)
-    
-    if len(errors) > 0:
-        print("")
-        print(bcolors.FAIL + bcolors.BOLD + "Errors:" + bcolors.ENDC)
-        for line in errors:
-            print(line)
+    metrics.finish_progress()
+
+    if len(zone_names) == 1:
+        zone_warnings[zone_names[0]] = warnings + zone_warnings[zone_names[0]]
+        warnings = []
+
+    print_section("Warnings:", bcolors.WARNING, warnings)
+
+    for zone_name in zone_names:
+        # Name the zone in the titles if there is more than one
+        suffix = ""
+        if len(zone_names) > 1:
+            suffix = " (zone %s)" % zone_name
 
+        print_section("Record sets successfully created%s:" % suffix, bcolors.OKGREEN, records_created[zone_name])
+        print_section("Record sets successfully updated%s:" % suffix, bcolors.OKGREEN, records_updated[zone_name])
+        print_section("Record sets successfully deleted%s:" % suffix, bcolors.OKGREEN, records_deleted[zone_name])
+        print_section("Warnings%s:" % suffix, bcolors.WARNING, zone_warnings[zone_name])
+        print_section("Errors%s:" % suffix, bcolors.FAIL, zone_errors[zone_name])
 
 if __name__ == "__main__":
     main()
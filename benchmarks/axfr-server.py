@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import socketserver
+import struct
+import sys
+import threading
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+
+# Number of resource records packed into one message of a zone transfer
+RRS_PER_MESSAGE = 200
+
+DEFAULT_MIX = "A=50,AAAA=10,CNAME=15,MX=5,TXT=10,SRV=5,PTR=3,CAA=2"
+
+
+def parse_mix(mix):
+    # Turn "A=50,AAAA=10" into a pattern of record types, which is repeated
+    # over the records of the zone.
+    pattern = []
+    for item in mix.split(","):
+        (record_type, weight) = item.split("=")
+        pattern.extend([ record_type.strip().upper() ] * int(weight))
+
+    return pattern
+
+
+def get_record_data(record_type, index, version):
+    if record_type == "A":
+        # Records changed between two versions of the zone get a new address
+        if version > 0:
+            return "172.16.%d.%d" % ((index >> 8) & 255, index & 255)
+        return "10.%d.%d.%d" % ((index >> 16) & 255, (index >> 8) & 255, index & 255)
+
+    if record_type == "AAAA":
+        return "2001:db8::%x:%x" % ((index >> 16) & 0xffff, index & 0xffff)
+
+    if record_type == "CNAME":
+        return "r0"
+
+    if record_type == "MX":
+        return "10 mail%d" % (index % 10)
+
+    if record_type == "TXT":
+        return "\"v=spf1 ip4:10.0.0.0/8 -all\" \"id=%d; generated\"" % index
+
+    if record_type == "SRV":
+        return "10 5 443 r0"
+
+    if record_type == "PTR":
+        return "r%d" % index
+
+    if record_type == "CAA":
+        return "0 issue \"ca.example.net\""
+
+    if record_type == "NS":
+        return "ns1.example.net."
+
+    raise ValueError("Record type %s is not supported by the generator." % record_type)
+
+
+class GeneratedZone(object):
+    # A zone of generated records. The zone exists in two versions: the
+    # current one with the serial given and the previous one with serial - 1.
+    # Both differ in the addresses of the first "changes" A records, which
+    # allows to serve incremental zone transfers.
+
+    def __init__(self, origin, records, mix, serial, changes, ttl):
+        self.origin = dns.name.from_text(origin)
+        self.records = records
+        self.pattern = parse_mix(mix)
+        self.serial = serial
+        self.ttl = ttl
+
+        self.changed = []
+        for index in range(records):
+            if len(self.changed) >= changes:
+                break
+            if self.get_type(index) == "A":
+                self.changed.append(index)
+
+        self.changed_set = set(self.changed)
+        self.lock = threading.Lock()
+        self.axfr_wire = None
+
+    def create_rrset(self, name, record_type, data):
+        # Names in the data of records are relative to the zone
+        return dns.rrset.from_text_list(name, self.ttl, dns.rdataclass.IN, record_type, [ data ], origin=self.origin, relativize=False)
+
+    def get_type(self, index):
+        return self.pattern[index % len(self.pattern)]
+
+    def get_rrset(self, index, version):
+        name = dns.name.from_text("r%d" % index, self.origin)
+        record_type = self.get_type(index)
+        return self.create_rrset(name, record_type, get_record_data(record_type, index, version))
+
+    def get_soa(self, serial):
+        return self.create_rrset(self.origin, "SOA", "ns1 hostmaster %d 3600 600 86400 300" % serial)
+
+    def get_apex_rrsets(self):
+        ns = self.create_rrset(self.origin, "NS", "ns1")
+        ns1 = self.create_rrset(dns.name.from_text("ns1", self.origin), "A", "192.0.2.1")
+        return [ ns, ns1 ]
+
+    def iterate_axfr(self):
+        soa = self.get_soa(self.serial)
+
+        yield soa
+        for rrset in self.get_apex_rrsets():
+            yield rrset
+
+        for index in range(self.records):
+            version = 1 if index in self.changed_set else 0
+            yield self.get_rrset(index, version)
+
+        yield soa
+
+    def iterate_ixfr(self):
+        # Condensed difference from serial - 1 to serial as of RFC 1995
+        soa = self.get_soa(self.serial)
+
+        yield soa
+        yield self.get_soa(self.serial - 1)
+        for index in self.changed:
+            yield self.get_rrset(index, 0)
+
+        yield soa
+        for index in self.changed:
+            yield self.get_rrset(index, 1)
+
+        yield soa
+
+    def get_axfr_wire(self, query):
+        # Messages of a full zone transfer are rendered once and reused.
+        with self.lock:
+            if self.axfr_wire is None:
+                self.axfr_wire = render_messages(query, self.iterate_axfr())
+
+        return self.axfr_wire
+
+
+def render_messages(query, rrsets):
+    messages = []
+
+    chunk = []
+    for rrset in rrsets:
+        chunk.append(rrset)
+        if len(chunk) >= RRS_PER_MESSAGE:
+            messages.append(render_message(query, chunk))
+            chunk = []
+
+    if chunk != []:
+        messages.append(render_message(query, chunk))
+
+    return messages
+
+
+def render_message(query, rrsets):
+    response = dns.message.make_response(query)
+    response.answer = rrsets
+    return response.to_wire(max_size=65535)
+
+
+def with_query_id(wire, query):
+    # Responses carry the ID of the query in their first two bytes
+    return struct.pack("!H", query.id) + wire[2:]
+
+
+def get_serial(query):
+    # The authority section of an IXFR query holds the SOA of the client
+    for rrset in query.authority:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            return rrset[0].serial
+
+    return None
+
+
+class ZoneTransferHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        zone = self.server.zone
+
+        while True:
+            length = self.receive(2)
+            if length is None:
+                return
+
+            query = dns.message.from_wire(self.receive(struct.unpack("!H", length)[0]))
+            question = query.question[0]
+
+            if question.name != zone.origin:
+                self.send([ render_refused(query) ])
+                continue
+
+            if question.rdtype == dns.rdatatype.AXFR:
+                self.send(zone.get_axfr_wire(query), query)
+
+            elif question.rdtype == dns.rdatatype.IXFR:
+                serial = get_serial(query)
+                if serial == zone.serial:
+                    # Client is up to date
+                    self.send(render_messages(query, [ zone.get_soa(zone.serial) ]))
+                elif serial == zone.serial - 1 and zone.changed != []:
+                    self.send(render_messages(query, zone.iterate_ixfr()))
+                else:
+                    # Fall back to a full zone transfer
+                    self.send(zone.get_axfr_wire(query), query)
+
+            else:
+                self.send([ render_answer(zone, query) ])
+
+    def receive(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+
+        return data
+
+    def send(self, messages, query=None):
+        for wire in messages:
+            if query is not None:
+                wire = with_query_id(wire, query)
+            self.request.sendall(struct.pack("!H", len(wire)) + wire)
+
+
+class QueryHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        (data, sock) = self.request
+        query = dns.message.from_wire(data)
+
+        if query.question[0].name != self.server.zone.origin:
+            sock.sendto(render_refused(query), self.client_address)
+        else:
+            sock.sendto(render_answer(self.server.zone, query), self.client_address)
+
+
+def render_answer(zone, query):
+    response = dns.message.make_response(query)
+    if query.question[0].rdtype == dns.rdatatype.SOA:
+        response.answer = [ zone.get_soa(zone.serial) ]
+
+    return response.to_wire()
+
+
+def render_refused(query):
+    response = dns.message.make_response(query)
+    response.set_rcode(dns.rcode.REFUSED)
+    return response.to_wire()
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ThreadingUDPServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def create_servers(zone, address, port):
+    tcp_server = ThreadingTCPServer((address, port), ZoneTransferHandler)
+    tcp_server.zone = zone
+
+    # Use the port the TCP server got, in case port 0 was requested
+    udp_server = ThreadingUDPServer((address, tcp_server.server_address[1]), QueryHandler)
+    udp_server.zone = zone
+
+    return (tcp_server, udp_server)
+
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="Local DNS server serving a generated zone via AXFR and IXFR for tests and benchmarks.", add_help=True)
+    parser.add_argument("--address", type=str, default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=5353, help="TCP and UDP port to listen on (default: 5353).")
+    parser.add_argument("--zone", type=str, default="example.com", help="Name of the zone to serve (default: example.com).")
+    parser.add_argument("--records", type=int, default=1000, help="Number of generated records (default: 1000).")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Weights of the generated record types (default: %s)." % DEFAULT_MIX)
+    parser.add_argument("--serial", type=int, default=2, help="Serial of the zone (default: 2).")
+    parser.add_argument("--changes", type=int, default=10, help="Number of A records changed since serial - 1, served via IXFR (default: 10).")
+    parser.add_argument("--ttl", type=int, default=300, help="TTL of the generated records (default: 300).")
+    args = parser.parse_args()
+
+    zone = GeneratedZone(args.zone, args.records, args.mix, args.serial, args.changes, args.ttl)
+
+    # Render the full zone transfer before accepting connections, so that
+    # the first transfer is not slowed down by it.
+    zone.get_axfr_wire(dns.message.make_query(zone.origin, dns.rdatatype.AXFR))
+
+    (tcp_server, udp_server) = create_servers(zone, args.address, args.port)
+
+    udp_thread = threading.Thread(target=udp_server.serve_forever)
+    udp_thread.daemon = True
+    udp_thread.start()
+
+    sys.stderr.write("Serving zone %s with %d records on %s port %d.\n" % (args.zone, args.records, args.address, tcp_server.server_address[1]))
+
+    try:
+        tcp_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.join(BENCHMARKS_DIR, os.pardir)
+
+sys.path.append(REPOSITORY_DIR)
+
+from dnstools.csvcodec import write_records
+from dnstools.records import Record
+
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+RESOURCE_GROUP = "dns-tools"
+ZONE_NAME = "benchmark.example"
+
+DEFAULT_SIZES = "1000,100000,1000000"
+
+# Record types of the generated zone, repeated over the records
+RECORD_TYPE_PATTERN = [ "A" ] * 7 + [ "AAAA" ] * 2 + [ "CNAME" ]
+
+
+def generate_records(count):
+    for index in range(count):
+        dns_name = "r%d.%s" % (index, ZONE_NAME)
+        record_type = RECORD_TYPE_PATTERN[index % len(RECORD_TYPE_PATTERN)]
+
+        if record_type == "A":
+            data = "10.%d.%d.%d" % ((index >> 16) & 255, (index >> 8) & 255, index & 255)
+        elif record_type == "AAAA":
+            data = "2001:db8::%x:%x" % ((index >> 16) & 0xffff, index & 0xffff)
+        else:
+            data = "r0.%s." % ZONE_NAME
+
+        yield Record(dns_name, 300, record_type, data)
+
+
+def get_free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(port, latency, requests_per_second):
+    command = [ sys.executable, os.path.join(BENCHMARKS_DIR, "azure-dns-server.py"), "--port", str(port), "--subscription-id", SUBSCRIPTION_ID, "--resource-group", RESOURCE_GROUP, "--zone", ZONE_NAME, "--latency", str(latency), "--requests-per-second", str(requests_per_second) ]
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+
+    # Wait until the server accepts connections
+    for attempt in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+
+    server.kill()
+    raise RuntimeError("Azure DNS stand-in did not start.")
+
+
+def request_statistics(port, path, data=None):
+    with urllib.request.urlopen("http://127.0.0.1:%d%s" % (port, path), data=data) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def run_tool(port, tool, arguments):
+    # Run a tool against the stand-in. Returns the time taken and the peak
+    # resident set size of the process in bytes.
+    env = dict(os.environ)
+    env["AZURE_DNS_ENDPOINT"] = "http://127.0.0.1:%d" % port
+    env["AZURE_SUBSCRIPTION_ID"] = SUBSCRIPTION_ID
+
+    # The stand-in throttles on its own if asked to, so the tools do not
+    # pace their requests
+    command = [ sys.executable, os.path.join(REPOSITORY_DIR, tool, "%s.py" % tool) ] + arguments + [ "--reads-per-second", "0", "--writes-per-second", "0" ]
+
+    request_statistics(port, "/stats/reset", b"")
+
+    start = time.time()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    (pid, status, rusage) = os.wait4(process.pid, 0)
+    seconds = time.time() - start
+
+    if status != 0:
+        raise RuntimeError("%s failed." % tool)
+
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    peak_rss = rusage.ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+
+    return (seconds, peak_rss, request_statistics(port, "/stats"))
+
+
+def get_result(tool, records, seconds, peak_rss, statistics):
+    return { "tool": tool, "records": records, "seconds": seconds, "records_per_second": records / seconds, "api_calls": statistics["requests"], "batch_requests": statistics["batch_requests"], "throttled": statistics["throttled"], "peak_rss": peak_rss }
+
+
+def benchmark(size, work_dir, workers, batch_size, latency, requests_per_second):
+    results = []
+
+    csv_filename = os.path.join(work_dir, "upload-%d.csv" % size)
+    write_records(csv_filename, generate_records(size))
+
+    port = get_free_port()
+    server = start_server(port, latency, requests_per_second)
+
+    try:
+        upload_arguments = [ "--resource-group", RESOURCE_GROUP, "--zone", ZONE_NAME, "--csv-file", csv_filename, "--workers", str(workers), "--batch-size", str(batch_size) ]
+        (seconds, peak_rss, statistics) = run_tool(port, "azure-zone-upload", upload_arguments)
+        results.append(get_result("azure-zone-upload", size, seconds, peak_rss, statistics))
+
+        download_arguments = [ "--resource-group", RESOURCE_GROUP, "--zone", ZONE_NAME, "--csv-file", os.path.join(work_dir, "download-%d.csv" % size) ]
+        (seconds, peak_rss, statistics) = run_tool(port, "azure-zone-download", download_arguments)
+        results.append(get_result("azure-zone-download", size, seconds, peak_rss, statistics))
+
+    finally:
+        server.kill()
+        server.wait()
+
+    return results
+
+
+def print_results(results):
+    print("%-20s %10s %10s %12s %10s %10s %10s" % ("Tool", "Records", "Seconds", "Records/s", "API calls", "Throttled", "RSS (MB)"))
+    for result in results:
+        print("%-20s %10d %10.2f %12.0f %10d %10d %10.1f" % (result["tool"], result["records"], result["seconds"], result["records_per_second"], result["api_calls"], result["throttled"], result["peak_rss"] / 1024.0 / 1024.0))
+
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="Benchmark of azure-zone-upload and azure-zone-download against a local stand-in of the Azure DNS API.", add_help=True)
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES, help="Comma separated numbers of records of the zones benchmarked (default: %s)." % DEFAULT_SIZES)
+    parser.add_argument("--workers", type=int, default=16, help="Workers of azure-zone-upload (default: 16).")
+    parser.add_argument("--batch-size", type=int, default=0, help="Batch size of azure-zone-upload (default: 0, no batching).")
+    parser.add_argument("--latency", type=float, default=0, help="Delay of every response of the stand-in in milliseconds (default: 0).")
+    parser.add_argument("--requests-per-second", type=int, default=0, help="Request rate above which the stand-in answers with HTTP 429 (default: 0, no throttling).")
+    parser.add_argument("--json-file", type=str, help="File to write the results to as JSON.")
+    args = parser.parse_args()
+
+    sizes = [ int(x) for x in args.sizes.split(",") ]
+
+    results = []
+    work_dir = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            results.extend(benchmark(size, work_dir, args.workers, args.batch_size, args.latency, args.requests_per_second))
+    finally:
+        shutil.rmtree(work_dir)
+
+    print_results(results)
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
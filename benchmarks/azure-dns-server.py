@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+# Number of record sets or zones returned per page, as by Azure
+PAGE_SIZE = 100
+
+ZONE_PATTERN = re.compile(r"^/subscriptions/([^/]+)/resourceGroups/([^/]+)/providers/Microsoft\.Network/dnsZones/([^/]+)$", re.IGNORECASE)
+RECORD_SETS_PATTERN = re.compile(r"^/subscriptions/([^/]+)/resourceGroups/([^/]+)/providers/Microsoft\.Network/dnsZones/([^/]+)/(all|recordsets)$", re.IGNORECASE)
+RECORD_SET_PATTERN = re.compile(r"^/subscriptions/([^/]+)/resourceGroups/([^/]+)/providers/Microsoft\.Network/dnsZones/([^/]+)/([A-Za-z]+)/([^/]+)$", re.IGNORECASE)
+ZONES_PATTERN = re.compile(r"^/subscriptions/([^/]+)(/resourceGroups/([^/]+))?/providers/Microsoft\.Network/dnsZones$", re.IGNORECASE)
+
+
+def get_zone_id(subscription_id, resource_group, zone_name):
+    return "/subscriptions/%s/resourceGroups/%s/providers/Microsoft.Network/dnszones/%s" % (subscription_id, resource_group, zone_name)
+
+
+def get_error(code, message):
+    return { "error": { "code": code, "message": message } }
+
+
+class DnsStore(object):
+    # Zones and record sets of the stand-in. Zones are kept by
+    # (resource group, zone name), record sets by (type, name) in the order
+    # they were created. Every version of a record set gets a new ETag.
+
+    def __init__(self, subscription_id):
+        self.subscription_id = subscription_id
+        self.lock = threading.Lock()
+        self.zones = {}
+        self.listings = {}
+        self.listing_counter = 0
+        self.etag_counter = 0
+
+    def create_etag(self):
+        # Called with the lock held
+        self.etag_counter += 1
+        return str(self.etag_counter)
+
+    def create_zone(self, resource_group, zone_name):
+        with self.lock:
+            key = (resource_group.lower(), zone_name.lower())
+            if key not in self.zones:
+                self.zones[key] = (resource_group, zone_name, {})
+
+                # Azure creates the SOA and NS record sets with the zone
+                record_sets = self.zones[key][2]
+                record_sets[("SOA", "@")] = ("@", "SOA", { "TTL": 3600, "SOARecord": { "host": "ns1-01.azure-dns.com.", "email": "azuredns-hostmaster.microsoft.com", "serialNumber": 1, "refreshTime": 3600, "retryTime": 300, "expireTime": 2419200, "minimumTTL": 300 } }, self.create_etag())
+                record_sets[("NS", "@")] = ("@", "NS", { "TTL": 172800, "NSRecords": [ { "nsdname": "ns1-01.azure-dns.com." }, { "nsdname": "ns2-01.azure-dns.net." } ] }, self.create_etag())
+
+            return self.zones[key]
+
+    def add_listing(self, items):
+        with self.lock:
+            self.listing_counter += 1
+            listing_id = str(self.listing_counter)
+            self.listings[listing_id] = items
+            return listing_id
+
+    def remove_listing(self, listing_id):
+        with self.lock:
+            self.listings.pop(listing_id, None)
+
+    def get_zone(self, resource_group, zone_name):
+        return self.zones.get((resource_group.lower(), zone_name.lower()))
+
+    def render_zone(self, zone):
+        (resource_group, zone_name, record_sets) = zone
+        return { "id": get_zone_id(self.subscription_id, resource_group, zone_name), "name": zone_name, "type": "Microsoft.Network/dnszones", "location": "global", "etag": "1", "properties": { "numberOfRecordSets": len(record_sets), "nameServers": [ "ns1-01.azure-dns.com.", "ns2-01.azure-dns.net." ] } }
+
+    def render_record_set(self, zone, record_set):
+        (resource_group, zone_name, record_sets) = zone
+        (name, record_type, properties, etag) = record_set
+
+        fqdn = "%s." % zone_name
+        if name != "@":
+            fqdn = "%s.%s." % (name, zone_name)
+
+        properties = dict(properties)
+        properties["fqdn"] = fqdn
+
+        return { "id": "%s/%s/%s" % (get_zone_id(self.subscription_id, resource_group, zone_name), record_type, name), "name": name, "type": "Microsoft.Network/dnszones/%s" % record_type, "etag": etag, "properties": properties }
+
+
+def get_page(store, query, url, get_items):
+    # Return a page of items together with the link to the next page. The
+    # items are taken once for the first page and kept until the last page
+    # was requested, so paging through large zones takes linear time.
+    if "$skipToken" not in query:
+        (listing_id, offset) = (None, 0)
+        items = get_items()
+    else:
+        (listing_id, offset) = query["$skipToken"][0].split(":")
+        offset = int(offset)
+        items = store.listings.get(listing_id)
+        if items is None:
+            return None
+
+    result = { "value": items[offset:offset + PAGE_SIZE] }
+
+    if offset + PAGE_SIZE < len(items):
+        if listing_id is None:
+            listing_id = store.add_listing(items)
+
+        next_query = dict([ (k, v[0]) for (k, v) in query.items() ])
+        next_query["$skipToken"] = "%s:%d" % (listing_id, offset + PAGE_SIZE)
+        result["nextLink"] = "%s?%s" % (url, urlencode(next_query))
+
+    elif listing_id is not None:
+        store.remove_listing(listing_id)
+
+    return result
+
+
+def is_precondition_failed(record_set, headers):
+    # Writes can be made conditional on the ETag of the record set (If-Match)
+    # or on the record set not existing yet (If-None-Match: *)
+    if headers.get("If-None-Match") == "*" and record_set is not None:
+        return True
+
+    if_match = headers.get("If-Match")
+    if if_match is not None and (record_set is None or if_match.strip('"') != record_set[3]):
+        return True
+
+    return False
+
+
+def handle_request(store, method, url, body, base_url, headers=None):
+    # Handle a request to the API. Returns (status code, JSON body).
+    if headers is None:
+        headers = {}
+
+    parsed = urlparse(url)
+    path = parsed.path
+    query = parse_qs(parsed.query)
+
+    m = RECORD_SET_PATTERN.match(path)
+    if m is not None:
+        zone = store.get_zone(m.group(2), m.group(3))
+        if zone is None:
+            return (404, get_error("ParentResourceNotFound", "Zone %s not found." % m.group(3)))
+
+        record_sets = zone[2]
+        record_type = m.group(4).upper()
+        key = (record_type, m.group(5).lower())
+
+        if method == "GET":
+            record_set = record_sets.get(key)
+            if record_set is None:
+                return (404, get_error("NotFound", "Record set not found."))
+
+            return (200, store.render_record_set(zone, record_set))
+
+        if method == "PUT":
+            with store.lock:
+                if is_precondition_failed(record_sets.get(key), headers):
+                    return (412, get_error("PreconditionFailed", "The condition specified using HTTP conditional header(s) is not met."))
+
+                status_code = 200 if key in record_sets else 201
+                record_sets[key] = (m.group(5), record_type, body.get("properties", {}), store.create_etag())
+                return (status_code, store.render_record_set(zone, record_sets[key]))
+
+        if method == "DELETE":
+            with store.lock:
+                if is_precondition_failed(record_sets.get(key), headers):
+                    return (412, get_error("PreconditionFailed", "The condition specified using HTTP conditional header(s) is not met."))
+
+                if key not in record_sets:
+                    return (204, None)
+
+                del record_sets[key]
+                return (200, None)
+
+    m = RECORD_SETS_PATTERN.match(path)
+    if m is not None and method == "GET":
+        zone = store.get_zone(m.group(2), m.group(3))
+        if zone is None:
+            return (404, get_error("ResourceNotFound", "Zone %s not found." % m.group(3)))
+
+        def get_record_sets():
+            with store.lock:
+                return list(zone[2].values())
+
+        # Only the record sets of the page requested are rendered
+        result = get_page(store, query, base_url + path, get_record_sets)
+        if result is None:
+            return (400, get_error("BadRequest", "Invalid skip token."))
+
+        result["value"] = [ store.render_record_set(zone, x) for x in result["value"] ]
+        return (200, result)
+
+    m = ZONE_PATTERN.match(path)
+    if m is not None:
+        if method == "PUT":
+            return (201, store.render_zone(store.create_zone(m.group(2), m.group(3))))
+
+        zone = store.get_zone(m.group(2), m.group(3))
+        if zone is None:
+            return (404, get_error("ResourceNotFound", "Zone %s not found." % m.group(3)))
+
+        return (200, store.render_zone(zone))
+
+    m = ZONES_PATTERN.match(path)
+    if m is not None and method == "GET":
+        def get_zones():
+            with store.lock:
+                return [ x for x in sorted(store.zones.values(), key=lambda x: (x[1], x[0])) if m.group(3) is None or x[0].lower() == m.group(3).lower() ]
+
+        result = get_page(store, query, base_url + path, get_zones)
+        if result is None:
+            return (400, get_error("BadRequest", "Invalid skip token."))
+
+        result["value"] = [ store.render_zone(x) for x in result["value"] ]
+        return (200, result)
+
+    return (404, get_error("NotFound", "Path %s not supported." % path))
+
+
+class Statistics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = { "requests": 0, "batch_requests": 0, "throttled": 0 }
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def get(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class Throttle(object):
+    # Answer requests exceeding the given rate per second with HTTP 429
+    def __init__(self, requests_per_second):
+        self.requests_per_second = requests_per_second
+        self.lock = threading.Lock()
+        self.second = 0
+        self.count = 0
+
+    def is_throttled(self):
+        if self.requests_per_second <= 0:
+            return False
+
+        with self.lock:
+            second = int(time.time())
+            if second != self.second:
+                self.second = second
+                self.count = 0
+
+            self.count += 1
+            return self.count > self.requests_per_second
+
+
+class AzureDnsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_method(self, method):
+        server = self.server
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = None
+        if length > 0:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+
+        # Statistics are not counted as API calls
+        if self.path == "/stats":
+            self.reply(200, server.statistics.get())
+            return
+
+        if method == "POST" and self.path == "/stats/reset":
+            with server.statistics.lock:
+                server.statistics.reset()
+            self.reply(200, server.statistics.get())
+            return
+
+        server.statistics.count("requests")
+
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        if server.throttle.is_throttled():
+            server.statistics.count("throttled")
+            self.reply(429, get_error("TooManyRequests", "The request is being throttled."), { "Retry-After": "1" })
+            return
+
+        if method == "POST" and urlparse(self.path).path == "/batch":
+            self.reply(200, self.handle_batch(body))
+            return
+
+        (status_code, result) = handle_request(server.store, method, self.path, body, server.base_url, self.headers)
+        self.reply(status_code, result)
+
+    def handle_batch(self, body):
+        responses = []
+        for request in body["requests"]:
+            self.server.statistics.count("batch_requests")
+            (status_code, result) = handle_request(self.server.store, request["httpMethod"], request["url"], request.get("content"), self.server.base_url)
+            responses.append({ "name": request.get("name"), "httpStatusCode": status_code, "content": result })
+
+        return { "responses": responses }
+
+    def reply(self, status_code, result, headers=None):
+        if headers is None:
+            headers = {}
+
+        data = b""
+        if result is not None:
+            data = json.dumps(result).encode("utf-8")
+
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_DELETE(self):
+        self.handle_method("DELETE")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def create_server(address, port, subscription_id, latency, requests_per_second):
+    server = ThreadingHTTPServer((address, port), AzureDnsHandler)
+    server.base_url = "http://%s:%d" % (address, server.server_address[1])
+    server.store = DnsStore(subscription_id)
+    server.statistics = Statistics()
+    server.throttle = Throttle(requests_per_second)
+    server.latency = latency
+    return server
+
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="Local stand-in of the Azure DNS API for tests and benchmarks.", add_help=True)
+    parser.add_argument("--address", type=str, default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080).")
+    parser.add_argument("--subscription-id", type=str, default="00000000-0000-0000-0000-000000000000", help="Subscription ID of the zones.")
+    parser.add_argument("--resource-group", type=str, default="dns-tools", help="Resource group of the zones created at start (default: dns-tools).")
+    parser.add_argument("--zone", type=str, action="append", default=[], help="Zone to create at start. Can be given more than once.")
+    parser.add_argument("--latency", type=float, default=0, help="Delay of every response in milliseconds (default: 0).")
+    parser.add_argument("--requests-per-second", type=int, default=0, help="Answer requests exceeding this rate with HTTP 429 (default: 0, no throttling).")
+    args = parser.parse_args()
+
+    server = create_server(args.address, args.port, args.subscription_id, args.latency / 1000.0, args.requests_per_second)
+    for zone_name in args.zone:
+        server.store.create_zone(args.resource_group, zone_name)
+
+    sys.stderr.write("Serving Azure DNS API on %s.\n" % server.base_url)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
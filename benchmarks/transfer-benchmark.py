@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.join(BENCHMARKS_DIR, os.pardir)
+
+ZONE_NAME = "benchmark.example"
+
+DEFAULT_SIZES = "1000,100000,1000000"
+DEFAULT_MIX = "A=50,AAAA=10,CNAME=15,MX=5,TXT=10,SRV=5,PTR=3,CAA=2"
+
+
+def load_tool():
+    # The file name of the tool is not a valid module name
+    path = os.path.join(REPOSITORY_DIR, "dns-zone-transfer-to-csv", "dns-zone-transfer-to-csv.py")
+    spec = importlib.util.spec_from_file_location("dns_zone_transfer_to_csv", path)
+    tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tool)
+    return tool
+
+
+def get_peak_rss():
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+
+    return peak_rss
+
+
+def measure(port, csv_filename):
+    # Run the phases of the tool one after the other and measure each of
+    # them. Peak memory is measured after every phase.
+    tool = load_tool()
+    result = {}
+
+    start = time.time()
+    zone = tool.zone_transfer(ZONE_NAME, "127.0.0.1", port)
+    result["transfer_seconds"] = time.time() - start
+    result["transfer_peak_rss"] = get_peak_rss()
+
+    start = time.time()
+    zone_dict = tool.create_zone_dict(zone)
+    result["conversion_seconds"] = time.time() - start
+    result["conversion_peak_rss"] = get_peak_rss()
+
+    start = time.time()
+    tool.write_zone_dict_to_csv_file(zone_dict, csv_filename)
+    result["write_seconds"] = time.time() - start
+    result["write_peak_rss"] = get_peak_rss()
+
+    result["records"] = sum([ len(x) for x in zone_dict.values() ])
+
+    return result
+
+
+def get_free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(port, size, mix):
+    command = [ sys.executable, os.path.join(BENCHMARKS_DIR, "axfr-server.py"), "--port", str(port), "--zone", ZONE_NAME, "--records", str(size), "--mix", mix ]
+    server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+
+    # Wait until the server accepts connections. Large zones take a while
+    # to be generated.
+    for attempt in range(3000):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except socket.error:
+            time.sleep(0.1)
+
+    server.kill()
+    raise RuntimeError("AXFR server did not start.")
+
+
+def benchmark(size, mix, work_dir):
+    port = get_free_port()
+    server = start_server(port, size, mix)
+
+    try:
+        # Every zone is measured in a process of its own, so that the peak
+        # memory is not influenced by the zones measured before.
+        command = [ sys.executable, os.path.abspath(__file__), "--measure-port", str(port), "--measure-csv-file", os.path.join(work_dir, "%d.csv" % size) ]
+        output = subprocess.check_output(command)
+
+    finally:
+        server.kill()
+        server.wait()
+
+    result = json.loads(output.decode("utf-8"))
+    result["size"] = size
+    return result
+
+
+def print_results(results):
+    # Times are given in seconds, memory in MB
+    print("%10s %10s %10s %10s %10s %10s %14s %10s" % ("Records", "Transfer", "Conversion", "Write", "Total", "Records/s", "Transfer RSS", "Peak RSS"))
+    for result in results:
+        total = result["transfer_seconds"] + result["conversion_seconds"] + result["write_seconds"]
+        print("%10d %10.2f %10.2f %10.2f %10.2f %10.0f %14.1f %10.1f" % (result["records"], result["transfer_seconds"], result["conversion_seconds"], result["write_seconds"], total, result["records"] / total, result["transfer_peak_rss"] / 1024.0 / 1024.0, result["write_peak_rss"] / 1024.0 / 1024.0))
+
+
+def main():
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="Benchmark of dns-zone-transfer-to-csv against a local AXFR server.", add_help=True)
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES, help="Comma separated numbers of records of the zones benchmarked (default: %s)." % DEFAULT_SIZES)
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Weights of the record types of the zones (default: %s)." % DEFAULT_MIX)
+    parser.add_argument("--json-file", type=str, help="File to write the results to as JSON.")
+    parser.add_argument("--measure-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--measure-csv-file", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure_port is not None:
+        print(json.dumps(measure(args.measure_port, args.measure_csv_file)))
+        return
+
+    sizes = [ int(x) for x in args.sizes.split(",") ]
+
+    results = []
+    work_dir = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            results.append(benchmark(size, args.mix, work_dir))
+    finally:
+        shutil.rmtree(work_dir)
+
+    print_results(results)
+
+    if args.json_file is not None:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
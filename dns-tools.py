@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import importlib.util
+import os
+import shlex
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(BASE_DIR)
+
+from dnstools import metrics
+from dnstools.console import print_error
+
+
+COMMANDS = [
+    ("azure-zone-download", "Download DNS record sets from Azure DNS zones and save them to CSV files."),
+    ("azure-zone-upload", "Upload DNS record sets to Azure DNS zones from a CSV file."),
+    ("dns-zone-convert", "Convert the records of CSV files to snapshot files and back."),
+    ("dns-zone-diff", "Compare the DNS records of two CSV files."),
+    ("dns-zone-transfer-to-csv", "Download DNS record sets via zone transfer and save them to CSV files."),
+]
+
+# Tools loaded so far by command
+tools = {}
+
+
+def get_command_filename(command):
+    # Tools are located in their own directory in the repository and next
+    # to this script in the Docker image
+    for filename in [ os.path.join(BASE_DIR, command, "%s.py" % command), os.path.join(BASE_DIR, "%s.py" % command) ]:
+        if os.path.exists(filename):
+            return filename
+
+    print_error("Command %s not found." % command)
+    sys.exit(1)
+
+
+def load_tool(command):
+    # The file names of the tools are not valid module names. A tool is only
+    # loaded when it is run, so the libraries of the other tools are never
+    # imported.
+    if command not in tools:
+        spec = importlib.util.spec_from_file_location(command.replace("-", "_"), get_command_filename(command))
+        tool = importlib.util.module_from_spec(spec)
+        # Functions run by process pools are looked up by module name
+        sys.modules[spec.name] = tool
+        spec.loader.exec_module(tool)
+        tools[command] = tool
+
+    return tools[command]
+
+
+def run_command(prog, command, arguments):
+    # Run a tool like from the command line. Returns the exit status.
+    tool = load_tool(command)
+
+    try:
+        tool.main(arguments, "%s %s" % (prog, command))
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+
+        # sys.exit() was called with a message
+        sys.stderr.write("%s\n" % e.code)
+        return 1
+    finally:
+        metrics.finish()
+
+    return 0
+
+
+def read_manifest(manifest_filename):
+    # Every line of the manifest holds a command and its arguments like on
+    # the command line. Empty lines and lines starting with "#" are ignored.
+    commands = [ x for (x, description) in COMMANDS ]
+    jobs = []
+
+    with open(manifest_filename, "r") as f:
+        for (line_number, line) in enumerate(f, 1):
+            if line.strip() == "" or line.strip().startswith("#"):
+                continue
+
+            try:
+                words = shlex.split(line)
+            except ValueError as e:
+                print_error("Invalid line %d in manifest: %s" % (line_number, e))
+                sys.exit(1)
+
+            if words[0] not in commands:
+                print_error("Invalid command %s in line %d of manifest." % (words[0], line_number))
+                sys.exit(1)
+
+            jobs.append((line_number, words[0], words[1:]))
+
+    return jobs
+
+
+def run_manifest(prog, manifest_filename, keep_going):
+    jobs = read_manifest(manifest_filename)
+
+    failed = 0
+    for (line_number, command, arguments) in jobs:
+        status = run_command(prog, command, arguments)
+        if status != 0:
+            failed += 1
+            print_error("Job in line %d of manifest failed (%s)." % (line_number, command))
+
+            if not keep_going:
+                break
+
+    if failed > 0:
+        print_error("%d of %d jobs failed." % (failed, len(jobs)))
+        return 1
+
+    return 0
+
+
+def main():
+    # Parse arguments. The arguments following the command are parsed by the
+    # tool.
+    epilog = "commands:\n%s" % "\n".join([ "  %-26s%s" % x for x in COMMANDS ])
+
+    parser = argparse.ArgumentParser(description="Run the DNS Tools from a single entry point.", epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter, add_help=True)
+    parser.add_argument("--manifest", type=str, help="File with one command and its arguments per line. All jobs are run one after the other in this process.")
+    parser.add_argument("--keep-going", action="store_true", help="Together with --manifest: run the remaining jobs after a job failed.")
+    parser.add_argument("command", nargs="?", choices=[ x for (x, description) in COMMANDS ], metavar="command", help="Tool to run.")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help="Arguments of the tool.")
+    args = parser.parse_args()
+
+    if (args.manifest is None) == (args.command is None):
+        print_error("Either a command or --manifest is required.")
+        sys.exit(1)
+
+    if args.manifest is not None:
+        sys.exit(run_manifest(parser.prog, args.manifest, args.keep_going))
+
+    sys.exit(run_command(parser.prog, args.command, args.arguments))
+
+
+if __name__ == "__main__":
+    main()
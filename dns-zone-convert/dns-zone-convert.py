@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dnstools import metrics
+from dnstools.console import bcolors, print_error, print_section
+from dnstools.csvcodec import read_records, write_records
+from dnstools.snapshot import SNAPSHOT_EXTENSION
+
+
+# Number of records counted at once in the metrics
+COUNT_BATCH_SIZE = 10000
+
+
+def count_records(records):
+    count = 0
+    for record in records:
+        count += 1
+        if count % COUNT_BATCH_SIZE == 0:
+            metrics.count("records", COUNT_BATCH_SIZE)
+
+        yield record
+
+    metrics.count("records", count % COUNT_BATCH_SIZE)
+
+
+def main(argv=None, prog=None):
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog, description="Tool to convert the records of CSV files to snapshot files and back.", add_help=True)
+    parser.add_argument("--input-file", type=str, required=True, help="CSV or snapshot file to read the records from.")
+    parser.add_argument("--output-file", type=str, required=True, help="File to write the records to. Files named *%s are written as snapshots, all others as CSV files." % SNAPSHOT_EXTENSION)
+    parser.add_argument("--parse-workers", type=int, default=1, help="Number of processes parsing large CSV files (default: 1).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    metrics.setup(args)
+
+    if args.parse_workers < 1:
+        print_error("--parse-workers must be at least 1.")
+        sys.exit(1)
+
+    if not os.path.isfile(args.input_file):
+        print_error("File %s does not exist." % args.input_file)
+        sys.exit(1)
+
+    with metrics.phase("converting"):
+        write_records(args.output_file, count_records(read_records(args.input_file, args.parse_workers)))
+
+    metrics.finish_progress()
+
+    print_section("Records converted:", bcolors.OKGREEN, [ "%d" % metrics.get_metrics()["counters"].get("records", 0) ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import argparse
+import operator
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from dnstools import metrics
+from dnstools.console import bcolors, print_error, print_section
+from dnstools.csvcodec import WRITE_BUFFER_SIZE, format_row, read_records
+from dnstools.extsort import DEFAULT_CHUNK_SIZE, sort_records
+from dnstools.names import normalize_zone_name, qualify_name
+from dnstools.records import RecordSet
+
+
+# Number of records counted at once in the metrics
+COUNT_BATCH_SIZE = 10000
+
+# Position of the referenced name in the data of records by record type. The
+# data is split at spaces.
+REFERENCED_NAME_FIELDS = {
+    "CNAME": 0,
+    "DNAME": 0,
+    "MX": 1,
+    "NS": 0,
+    "PTR": 0,
+    "SOA": 0,
+    "SRV": 3,
+}
+
+
+def normalize_name(dns_name, zone_name):
+    # Names are compared case-insensitively like in DNS, with or without a
+    # trailing dot, and "@" stands for the apex of the zone.
+    dns_name = dns_name.lower().rstrip(".")
+    if dns_name == "@" and zone_name is not None:
+        return zone_name
+
+    return dns_name
+
+
+def normalize_data(record_type, data, zone_name):
+    # Referenced names are made absolute. Without a zone, names not
+    # terminated with a dot are taken as absolute names.
+    index = REFERENCED_NAME_FIELDS.get(record_type)
+    if index is None:
+        return data
+
+    fields = data.split(" ")
+    if index >= len(fields):
+        return data
+
+    ref_name = fields[index].lower()
+    if zone_name is not None:
+        fields[index] = qualify_name(ref_name, zone_name)
+    elif not ref_name.endswith("."):
+        fields[index] = ref_name + "."
+    else:
+        fields[index] = ref_name
+
+    return " ".join(fields)
+
+
+def normalize_records(records, zone_name):
+    # Records are normalized in place. They are counted in batches, as
+    # counting every record would take a considerable part of the time.
+    count = 0
+    for record in records:
+        record.name = sys.intern(normalize_name(record.name, zone_name))
+        record.type = sys.intern(record.type.upper())
+        record.data = normalize_data(record.type, record.data, zone_name)
+        yield record
+
+        count += 1
+        if count == COUNT_BATCH_SIZE:
+            metrics.count("records", count)
+            count = 0
+
+    metrics.count("records", count)
+
+
+def read_sorted_record_sets(csv_filename, zone_name, sort_chunk_size, parse_workers):
+    # Yield the record sets of a CSV file sorted by name and type. The file
+    # is sorted with an external merge sort, so files of any order and size
+    # can be compared with bounded memory.
+    records = normalize_records(read_records(csv_filename, parse_workers), zone_name)
+    record_set = None
+
+    for record in sort_records(records, operator.attrgetter("name", "type"), sort_chunk_size):
+        if record_set is not None and record.name == record_set.name and record.type == record_set.type:
+            # Assumption: TTL is the same for each entry of a DNS record set.
+            # Thus, we take the last occurence.
+            record_set.ttl = record.ttl
+            record_set.data.append(record.data)
+            continue
+
+        if record_set is not None:
+            record_set.data = sorted(set(record_set.data))
+            yield record_set
+
+        record_set = RecordSet(record.name, record.type, record.ttl, [ record.data ])
+
+    if record_set is not None:
+        record_set.data = sorted(set(record_set.data))
+        yield record_set
+
+
+def merge_record_sets(old_record_sets, new_record_sets):
+    # Walk through both sorted streams at once. Yields pairs of record sets
+    # with the same name and type; the old or the new record set is None if
+    # it only exists in the other file.
+    old_record_set = next(old_record_sets, None)
+    new_record_set = next(new_record_sets, None)
+
+    while old_record_set is not None or new_record_set is not None:
+        if new_record_set is None or (old_record_set is not None and (old_record_set.name, old_record_set.type) < (new_record_set.name, new_record_set.type)):
+            yield (old_record_set, None)
+            old_record_set = next(old_record_sets, None)
+
+        elif old_record_set is None or (new_record_set.name, new_record_set.type) < (old_record_set.name, old_record_set.type):
+            yield (None, new_record_set)
+            new_record_set = next(new_record_sets, None)
+
+        else:
+            yield (old_record_set, new_record_set)
+            old_record_set = next(old_record_sets, None)
+            new_record_set = next(new_record_sets, None)
+
+
+def get_lines(prefix, record_set, data):
+    return [ (prefix, record_set.name, record_set.ttl, record_set.type, x) for x in data ]
+
+
+def diff_record_sets(old_record_sets, new_record_sets, f):
+    # Write the differences as CSV rows prefixed with "-" (only in the old
+    # file) and "+" (only in the new file). Records of a record set with a
+    # changed TTL are all replaced. Returns the number of record sets added,
+    # removed, changed and with a changed TTL.
+    added = 0
+    removed = 0
+    changed = 0
+    ttl_changed = 0
+
+    for (old_record_set, new_record_set) in merge_record_sets(old_record_sets, new_record_sets):
+        if old_record_set is None:
+            lines = get_lines("+", new_record_set, new_record_set.data)
+            added += 1
+
+        elif new_record_set is None:
+            lines = get_lines("-", old_record_set, old_record_set.data)
+            removed += 1
+
+        elif old_record_set.ttl != new_record_set.ttl:
+            lines = get_lines("-", old_record_set, old_record_set.data) + get_lines("+", new_record_set, new_record_set.data)
+            changed += 1
+            ttl_changed += 1
+
+        elif old_record_set.data != new_record_set.data:
+            new_data = set(new_record_set.data)
+            old_data = set(old_record_set.data)
+            lines = get_lines("-", old_record_set, [ x for x in old_record_set.data if x not in new_data ]) + get_lines("+", new_record_set, [ x for x in new_record_set.data if x not in old_data ])
+            changed += 1
+
+        else:
+            continue
+
+        for (prefix, name, ttl, record_type, data) in lines:
+            f.write("%s %s" % (prefix, format_row(name, ttl, record_type, data)))
+
+    return (added, removed, changed, ttl_changed)
+
+
+def main(argv=None, prog=None):
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog, description="Tool to compare the records of two CSV files, e.g. of a zone before and after a migration.", add_help=True)
+    parser.add_argument("--old-csv-file", type=str, required=True, help="CSV file with the records before the change.")
+    parser.add_argument("--new-csv-file", type=str, required=True, help="CSV file with the records after the change.")
+    parser.add_argument("--zone", type=str, help="Name of the DNS zone. Names \"@\" and referenced names not terminated with a dot are taken as relative to the zone.")
+    parser.add_argument("--output-file", type=str, help="File to write the differences to instead of the console.")
+    parser.add_argument("--exit-code", action="store_true", help="Exit with status 1 if the files differ.")
+    parser.add_argument("--sort-chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Number of records sorted in memory at once (default: %d)." % DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--parse-workers", type=int, default=1, help="Number of processes parsing large CSV files (default: 1).")
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    metrics.setup(args)
+
+    if args.sort_chunk_size < 1 or args.parse_workers < 1:
+        print_error("--sort-chunk-size and --parse-workers must be at least 1.")
+        sys.exit(1)
+
+    for csv_filename in [ args.old_csv_file, args.new_csv_file ]:
+        if not os.path.isfile(csv_filename):
+            print_error("CSV file %s does not exist." % csv_filename)
+            sys.exit(1)
+
+    zone_name = None
+    if args.zone is not None:
+        zone_name = normalize_zone_name(args.zone).lower()
+
+    old_record_sets = read_sorted_record_sets(args.old_csv_file, zone_name, args.sort_chunk_size, args.parse_workers)
+    new_record_sets = read_sorted_record_sets(args.new_csv_file, zone_name, args.sort_chunk_size, args.parse_workers)
+
+    with metrics.phase("diffing"):
+        if args.output_file is not None:
+            with open(args.output_file, "w", buffering=WRITE_BUFFER_SIZE) as f:
+                (added, removed, changed, ttl_changed) = diff_record_sets(old_record_sets, new_record_sets, f)
+        else:
+            (added, removed, changed, ttl_changed) = diff_record_sets(old_record_sets, new_record_sets, sys.stdout)
+
+    metrics.finish_progress()
+
+    summary = [ "Record sets added: %d" % added, "Record sets removed: %d" % removed, "Record sets changed: %d (TTL changed: %d)" % (changed, ttl_changed) ]
+    print_section("Summary:", bcolors.OKBLUE, summary)
+
+    if args.exit_code and added + removed + changed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
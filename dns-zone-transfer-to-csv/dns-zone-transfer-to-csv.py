@@ -25,123 +25,460 @@ SOFTWARE.
 """
 
 import argparse
-import dns.zone
-import dns.query
 from dns.exception import DNSException
-from dns.rdatatype import *
+import dns.inet
+from dns.rdatatype import A, AAAA, CAA, CNAME, DNAME, MX, NS, PTR, SOA, SPF, SRV, TXT
+import heapq
+import multiprocessing
 import operator
-import re
+import os
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 
-def zone_transfer(zone, server):
-    try:
-        zone = dns.zone.from_xfr(dns.query.xfr(server, zone))
-    except DNSException as e:
-        print(e.__class__, e)
-        sys.exit(1)
+from dnstools import metrics
+from dnstools.console import bcolors, print_error, print_section
+from dnstools.csvcodec import replace_on_success, write_records, write_zone_files
+from dnstools.extsort import DEFAULT_CHUNK_SIZE, sort_records
+from dnstools.names import get_absolute_name, get_duplicate_names, normalize_zone_name
+from dnstools.records import Record
 
-    return zone
 
+SOA_QUERY_TIMEOUT = 5
 
-def create_zone_dict(zone):
+# Zones with fewer nodes are converted by a single process
+PARALLEL_MIN_NODES = 100000
+
+# Order of the records within a name and within a zone
+RECORD_ORDER = operator.attrgetter("type", "data")
+ZONE_ORDER = operator.attrgetter("name", "type", "data")
+
+# Nodes of the zone converted by a worker process. They are inherited from
+# the parent process when the worker is forked instead of being pickled,
+# which would take longer than the conversion itself.
+conversion_nodes = None
+
+
+def count_transferred_records(messages):
+    for message in messages:
+        metrics.count("records", sum([ len(rrset) for rrset in message.answer ]))
+        yield message
+
+
+def zone_transfer(zone, server, port=53):
+    # Imported here, as these modules take a while to import
+    import dns.query
+    import dns.zone
+
+    metrics.count("zone_transfers")
+    return dns.zone.from_xfr(count_transferred_records(dns.query.xfr(server, zone, port=port)))
+
+
+def query_soa_serial(zone, server):
+    import dns.message
+    import dns.query
+
+    metrics.count("soa_queries")
+    response = dns.query.udp(dns.message.make_query(zone, SOA), server, timeout=SOA_QUERY_TIMEOUT)
+    for rrset in response.answer:
+        if rrset.rdtype == SOA:
+            return rrset[0].serial
+
+    raise DNSException("No SOA record received for zone %s." % zone)
+
+
+def get_zone_serial(zone):
+    return zone.find_rdataset(zone.origin, SOA)[0].serial
+
+
+def incremental_zone_transfer(zone, server, state_filename):
+    # The state file holds the zone as of the last transfer in master file
+    # format. If it exists, only an SOA query is sent to learn whether the
+    # zone changed. If it did, an IXFR is requested and the differences are
+    # applied to the zone. Servers may answer an IXFR with a full zone
+    # transfer, which is handled as well.
+    import dns.query
+    import dns.xfr
+    import dns.zone
+
+    if not os.path.exists(state_filename):
+        zone_obj = zone_transfer(zone, server)
+    else:
+        zone_obj = dns.zone.from_file(state_filename, origin=zone)
+
+        if query_soa_serial(zone, server) == get_zone_serial(zone_obj):
+            return zone_obj
+
+        (query, serial) = dns.xfr.make_query(zone_obj)
+        metrics.count("zone_transfers")
+        dns.query.inbound_xfr(server, zone_obj, query)
+
+    # Replace the state file only once it is complete
+    temp_state_filename = "%s.tmp" % state_filename
+    zone_obj.to_file(temp_state_filename, sorted=True)
+    os.replace(temp_state_filename, state_filename)
+
+    return zone_obj
+
+
+def create_name_qualifier(origin):
+    # Return a function converting names referenced by records to absolute
+    # names. Zones reference the same names many times, e.g. as targets of
+    # CNAME records, so every name is converted only once. The names are
+    # derelativized instead of joined as text, as the text of the zone apex
+    # relative to the origin is "@".
+    import dns.name
+
+    origin_name = dns.name.from_text(origin)
+    qualified_names = {}
+
+    def qualify(name):
+        qualified_name = qualified_names.get(name)
+        if qualified_name is None:
+            qualified_name = name.derelativize(origin_name).to_text()
+            qualified_names[name] = qualified_name
+
+        return qualified_name
+
+    return qualify
+
+
+def format_address(rdata, qualify):
+    return rdata.address
+
+
+def format_target(rdata, qualify):
+    return qualify(rdata.target)
+
+
+def format_mx(rdata, qualify):
+    return "%d %s" % (rdata.preference, qualify(rdata.exchange))
+
+
+def format_srv(rdata, qualify):
+    return "%d %d %d %s" % (rdata.priority, rdata.weight, rdata.port, qualify(rdata.target))
+
+
+def format_soa(rdata, qualify):
+    return "%s %s %s %s %s %s %s" % (qualify(rdata.mname), rdata.rname, rdata.serial, rdata.refresh, rdata.retry, rdata.expire, rdata.minimum)
+
+
+def format_text(rdata, qualify):
+    # Character strings are quoted as in zone files
+    return rdata.to_text()
+
+
+# Names and record data formats by record type. Records of other types are
+# written as in zone files with absolute names.
+RECORD_TYPES = {
+    A: ("A", format_address),
+    AAAA: ("AAAA", format_address),
+    CAA: ("CAA", format_text),
+    CNAME: ("CNAME", format_target),
+    DNAME: ("DNAME", format_target),
+    MX: ("MX", format_mx),
+    NS: ("NS", format_target),
+    PTR: ("PTR", format_target),
+    SOA: ("SOA", format_soa),
+    SPF: ("SPF", format_text),
+    SRV: ("SRV", format_srv),
+    TXT: ("TXT", format_text),
+}
+
+
+def get_records(dns_name, origin, rdataset, qualify):
+    ttl = rdataset.ttl
+
+    if rdataset.rdtype not in RECORD_TYPES:
+        import dns.name
+        import dns.rdatatype
+
+        record_type = dns.rdatatype.to_text(rdataset.rdtype)
+        origin_name = dns.name.from_text(origin)
+        return [ Record(dns_name, ttl, record_type, rdata.to_text(origin=origin_name, relativize=False)) for rdata in rdataset ]
+
+    (record_type, format_data) = RECORD_TYPES[rdataset.rdtype]
+    return [ Record(dns_name, ttl, record_type, format_data(rdata, qualify)) for rdata in rdataset ]
+
+
+def create_zone_dict_from_nodes(nodes, origin):
     zone_dict = {}
-    try:
-        origin = re.sub(r"\.$", r"", str(zone.origin))
-        for name, node in zone.nodes.items():
-            rdatasets = node.rdatasets
-            if str(name) == "@":
-                dns_name = origin
-            else:
-                dns_name = "%s.%s" % (str(name), origin)
-            
-            for rdataset in rdatasets:
-                ttl = rdataset.ttl
-
-                if rdataset.rdtype == SOA:
-                    for rdata in rdataset:
-                        mname = str(rdata.mname)
-                        if not mname.endswith("."):
-                            mname = "%s.%s." % (mname, origin)
-                        
-                        data = "%s %s %s %s %s %s %s" % (mname, rdata.rname, rdata.serial, rdata.refresh, rdata.retry, rdata.expire, rdata.minimum) 
-                        
-                        if dns_name in zone_dict:
-                            zone_dict[dns_name].append({"ttl": ttl, "type": "SOA", "data": data})
-                        else:
-                            zone_dict[dns_name] = [ {"ttl": ttl, "type": "SOA", "data": data} ]
-                    
-                elif rdataset.rdtype == NS:
-                    for rdata in rdataset:
-                        target = str(rdata.target)
-                        if not target.endswith("."):
-                            target = "%s.%s." % (target, origin)
-                        
-                        if dns_name in zone_dict:
-                            zone_dict[dns_name].append({"ttl": ttl, "type": "NS", "data": target})
-                        else:
-                            zone_dict[dns_name] = [ {"ttl": ttl, "type": "NS", "data": target} ]
-                    
-                elif rdataset.rdtype == CNAME:
-                    for rdata in rdataset:
-                        target = str(rdata.target)
-                        if not target.endswith("."):
-                            target = "%s.%s." % (target, origin)
-                        
-                        if dns_name in zone_dict:
-                            zone_dict[dns_name].append({"ttl": ttl, "type": "CNAME", "data": target})
-                        else:
-                            zone_dict[dns_name] = [ {"ttl": ttl, "type": "CNAME", "data": target} ]
-                    
-                elif rdataset.rdtype == A:
-                    for rdata in rdataset:
-                        if dns_name in zone_dict:
-                            zone_dict[dns_name].append({"ttl": ttl, "type": "A", "data": str(rdata.address)})
-                        else:
-                            zone_dict[dns_name] = [ {"ttl": ttl, "type": "A", "data": str(rdata.address)} ]
-                    
-                elif rdataset.rdtype == AAAA:
-                    for rdata in rdataset:
-                        if dns_name in zone_dict:
-                            zone_dict[dns_name].append({"ttl": ttl, "type": "AAAA", "data": str(rdata.address)})
-                        else:
-                            zone_dict[dns_name] = [ {"ttl": ttl, "type": "AAAA", "data": str(rdata.address)} ]
-                    
-                else:
-                    print("Record type not implemented.")
-                    sys.exit(1)
-    
-    except DNSException as e:
-        print(e.__class__, e)
-        sys.exit(1)
+
+    qualify = create_name_qualifier(origin)
+
+    for name, node in nodes:
+        dns_name = get_absolute_name(str(name), origin)
+        records = zone_dict.setdefault(dns_name, [])
+
+        for rdataset in node.rdatasets:
+            records.extend(get_records(dns_name, origin, rdataset, qualify))
+
+        # The order of record sets and records in a node depends on how the
+        # zone was built, e.g. by a full or an incremental zone transfer.
+        # They are sorted to write the same file either way, and the same as
+        # --stream --sort.
+        if len(records) > 1:
+            records.sort(key=RECORD_ORDER)
 
     return zone_dict
 
-def write_zone_dict_to_csv_file(zone_dict, csv_filename):
-    f = open(csv_filename, "w")
 
+def create_zone_dict(zone):
+    return create_zone_dict_from_nodes(zone.nodes.items(), normalize_zone_name(str(zone.origin)))
+
+
+def set_conversion_nodes(nodes):
+    global conversion_nodes
+    conversion_nodes = nodes
+
+
+def convert_partition(origin, start, end):
+    # Convert a partition of the nodes in a worker process. The records are
+    # returned sorted by name as tuples, as these are passed back to the
+    # parent process much faster than records.
+    zone_dict = create_zone_dict_from_nodes(conversion_nodes[start:end], origin)
+    return [ (x.name, x.ttl, x.type, x.data) for dns_name in sorted(zone_dict) for x in zone_dict[dns_name] ]
+
+
+def convert_zone_parallel(zone, workers):
+    # Split the nodes of the zone into one partition per worker and convert
+    # the partitions in a pool of forked processes. Returns the records of
+    # every partition sorted by name.
+    origin = normalize_zone_name(str(zone.origin))
+    nodes = list(zone.nodes.items())
+    size = -(-len(nodes) // workers)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"), initializer=set_conversion_nodes, initargs=(nodes,)) as executor:
+        futures = [ executor.submit(convert_partition, origin, start, start + size) for start in range(0, len(nodes), size) ]
+        return [ future.result() for future in futures ]
+
+
+def write_zone_dict_to_csv_file(zone_dict, csv_filename):
     dns_names_sorted = sorted(zone_dict)
 
-    for dns_name in dns_names_sorted:
-        records = zone_dict[dns_name]
-        for record in records:
-            csv_row = "%s;%s;%s;%s\n" % (dns_name, record["ttl"], record["type"], record["data"])
-            f.write(csv_row)
+    records = ( record for dns_name in dns_names_sorted for record in zone_dict[dns_name] )
+    write_records(csv_filename, records)
+
+
+def write_partitions_to_csv_file(partitions, csv_filename):
+    # Every name is found in one partition only, so a k-way merge of the
+    # sorted partitions gives the same order as sorting the whole zone
+    rows = heapq.merge(*partitions, key=operator.itemgetter(0))
+    write_records(csv_filename, ( Record(name, ttl, record_type, data) for (name, ttl, record_type, data) in rows ))
+
+
+def stream_zone_transfer(zone, server):
+    # Yield the records of the zone transfer as the messages of the server
+    # arrive, without building the zone in memory.
+    import dns.query
+
+    origin = normalize_zone_name(zone)
+    qualify = create_name_qualifier(origin)
+    soa_received = False
+
+    metrics.count("zone_transfers")
+
+    for message in count_transferred_records(dns.query.xfr(server, zone)):
+        for rrset in message.answer:
+            # The zone transfer ends with the SOA record it starts with.
+            if rrset.rdtype == SOA:
+                if soa_received:
+                    continue
+                soa_received = True
+
+            dns_name = get_absolute_name(str(rrset.name), origin)
+            for record in get_records(dns_name, origin, rrset, qualify):
+                yield record
+
+
+def transfer_zone_to_csv_file(zone, server, csv_filename, stream, sort, sort_chunk_size, state_filename=None, conversion_workers=1):
+    # The CSV file is only replaced once it is complete
+    with replace_on_success(csv_filename) as temp_csv_filename:
+        if stream:
+            # Transfer, conversion and writing are interleaved
+            with metrics.phase("transfer"):
+                records = stream_zone_transfer(zone, server)
+                if sort:
+                    records = sort_records(records, ZONE_ORDER, sort_chunk_size)
+
+                write_records(temp_csv_filename, records)
+
+            return
+
+        with metrics.phase("transfer"):
+            if state_filename is not None:
+                zone_obj = incremental_zone_transfer(zone, server, state_filename)
+            else:
+                zone_obj = zone_transfer(zone, server)
+
+        # Large zones are converted by several processes where these can be
+        # forked
+        if conversion_workers > 1 and len(zone_obj.nodes) >= PARALLEL_MIN_NODES and "fork" in multiprocessing.get_all_start_methods():
+            with metrics.phase("conversion"):
+                partitions = convert_zone_parallel(zone_obj, conversion_workers)
+
+            with metrics.phase("writing"):
+                write_partitions_to_csv_file(partitions, temp_csv_filename)
+
+            return
+
+        with metrics.phase("conversion"):
+            zone_dict = create_zone_dict(zone_obj)
+
+        with metrics.phase("writing"):
+            write_zone_dict_to_csv_file(zone_dict, temp_csv_filename)
+
+
+def read_zones_file(zones_filename, default_server):
+    # Each line holds a zone name and optionally the server to transfer the
+    # zone from, separated by ";". Empty lines and lines starting with "#"
+    # are ignored, as well as duplicate lines.
+    zones = []
+
+    with open(zones_filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+
+            x = line.split(";")
+            if len(x) > 2:
+                print_error("Invalid zones file provided!")
+                sys.exit(1)
+
+            zone = normalize_zone_name(x[0])
+            server = x[1] if len(x) == 2 else default_server
+
+            if server is None:
+                print_error("No server given for zone %s. Please add it to the zones file or use --server." % zone)
+                sys.exit(1)
+
+            if (zone, server) not in zones:
+                zones.append((zone, server))
 
-    f.close()
+    return zones
 
 
-def main():
+def transfer_zone_with_limit(zone, server, csv_filename, stream, sort, sort_chunk_size, server_semaphore):
+    # Zone transfers are sent to IP addresses only
+    if not dns.inet.is_address(server):
+        metrics.count("errors")
+        return "Zone transfer of %s from %s failed: %s is not an IP address." % (zone, server, server)
+
+    with server_semaphore:
+        try:
+            transfer_zone_to_csv_file(zone, server, csv_filename, stream, sort, sort_chunk_size)
+        except (DNSException, EOFError, EnvironmentError) as e:
+            metrics.count("errors")
+            return "Zone transfer of %s from %s failed: %s" % (zone, server, e)
+
+    return None
+
+
+def transfer_zones(zones, csv_filename, output_dir, workers, max_transfers_per_server, stream, sort, sort_chunk_size):
+    zones_transferred = []
+    errors = []
+
+    # Limit the number of concurrent zone transfers from the same server
+    server_semaphores = {}
+    for (zone, server) in zones:
+        server_semaphores[server] = threading.Semaphore(max_transfers_per_server)
+
+    def transfer(zone, zone_csv_filename):
+        (zone_name, server) = zone
+        return (None, transfer_zone_with_limit(zone_name, server, zone_csv_filename, stream, sort, sort_chunk_size, server_semaphores[server]))
+
+    # The zones are concatenated in the order of the zones file
+    results = write_zone_files(zones, [ zone for (zone, server) in zones ], csv_filename, output_dir, workers, transfer)
+
+    for ((zone, server), (result, error)) in zip(zones, results):
+        if error is not None:
+            errors.append(error)
+        else:
+            zones_transferred.append(zone)
+
+    return (zones_transferred, errors)
+
+
+def main(argv=None, prog=None):
     # Parse arguments
-    parser = argparse.ArgumentParser(description="Tool to perform a DNS zone transfer and write the records to a CSV file.", add_help=True)
-    parser.add_argument("--server", type=str, required=True, help="IP address of the DNS server to query.")
-    parser.add_argument("--zone", type=str, required=True, help="Name of the DNS zone to transfer.")
-    parser.add_argument("--csv-file", type=str, required=True, help="Name of the CSV file to write the results to.")
-    args = parser.parse_args()
-
-    zone = zone_transfer(args.zone, args.server)
-    zone_dict = create_zone_dict(zone)
-    write_zone_dict_to_csv_file(zone_dict, args.csv_file)
+    parser = argparse.ArgumentParser(prog=prog, description="Tool to perform a DNS zone transfer and write the records to a CSV file.", add_help=True)
+    parser.add_argument("--server", type=str, required=False, help="IP address of the DNS server to query.")
+    zone_group = parser.add_mutually_exclusive_group(required=True)
+    zone_group.add_argument("--zone", type=str, help="Name of the DNS zone to transfer.")
+    zone_group.add_argument("--zones-file", type=str, help="File with the DNS zones to transfer, one per line as <zone>[;<server>].")
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument("--csv-file", type=str, help="Name of the CSV file to write the results to.")
+    output_group.add_argument("--output-dir", type=str, help="Together with --zones-file: directory to write one CSV file per zone to.")
+    parser.add_argument("--workers", type=int, default=8, help="Together with --zones-file: number of zones transferred concurrently (default: 8).")
+    parser.add_argument("--max-transfers-per-server", type=int, default=2, help="Together with --zones-file: number of concurrent zone transfers per server (default: 2).")
+    parser.add_argument("--stream", action="store_true", help="Write records to the CSV file while they are received instead of building the zone in memory first.")
+    parser.add_argument("--sort", action="store_true", help="Together with --stream: sort the CSV file by name using an external merge sort.")
+    parser.add_argument("--state-file", type=str, help="File to keep the zone in between runs. If it exists, only changes since the last run are transferred (IXFR).")
+    parser.add_argument("--sort-chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Number of records sorted in memory at once by --sort (default: %d)." % DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--conversion-workers", type=int, default=1, help="Together with --zone and without --stream: number of processes converting zones of more than %d names to records (default: 1)." % PARALLEL_MIN_NODES)
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    metrics.setup(args)
+
+    if args.state_file is not None and (args.zones_file is not None or args.stream):
+        print_error("--state-file can not be combined with --zones-file or --stream.")
+        sys.exit(1)
+
+    if args.conversion_workers < 1:
+        print_error("--conversion-workers must be at least 1.")
+        sys.exit(1)
+
+    # Worker processes are forked, which is not safe from the threads
+    # transferring the zones of a zones file
+    if args.conversion_workers > 1 and (args.stream or args.zones_file is not None):
+        print_error("--conversion-workers can not be combined with --stream or --zones-file.")
+        sys.exit(1)
+
+    if args.zones_file is None:
+        if args.server is None:
+            print_error("--server is a required parameter.")
+            sys.exit(1)
+
+        if args.output_dir is not None:
+            print_error("--output-dir can only be used together with --zones-file.")
+            sys.exit(1)
+
+        try:
+            transfer_zone_to_csv_file(args.zone, args.server, args.csv_file, args.stream, args.sort, args.sort_chunk_size, args.state_file, args.conversion_workers)
+        except (DNSException, EOFError, EnvironmentError) as e:
+            metrics.finish_progress()
+            print(e.__class__, e)
+            sys.exit(1)
+
+        return
+
+    if args.workers < 1 or args.max_transfers_per_server < 1:
+        print_error("--workers and --max-transfers-per-server must be at least 1.")
+        sys.exit(1)
+
+    zones = read_zones_file(args.zones_file, args.server)
+
+    if args.output_dir is not None:
+        # Transfers of the same zone from different servers would be written
+        # to the same file
+        duplicates = get_duplicate_names([ zone for (zone, server) in zones ])
+        if duplicates != []:
+            print_error("Zones %s are listed with more than one server. Use --csv-file or list each zone once." % ", ".join(duplicates))
+            sys.exit(1)
+
+    (zones_transferred, errors) = transfer_zones(zones, args.csv_file, args.output_dir, args.workers, args.max_transfers_per_server, args.stream, args.sort, args.sort_chunk_size)
+
+    metrics.finish_progress()
+
+    print_section("Zones successfully transferred:", bcolors.OKGREEN, zones_transferred)
+    print_section("Errors:", bcolors.FAIL, errors)
+
+    if len(errors) > 0:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
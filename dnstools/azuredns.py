@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import getpass
+import os
+import sys
+import time
+from urllib.parse import quote
+
+from dnstools import metrics
+from dnstools.console import print_error
+from dnstools.names import get_duplicate_names
+from dnstools.ratelimit import TokenBucket
+
+
+THROTTLE_MAX_RETRIES = 8
+THROTTLE_INITIAL_DELAY = 1
+THROTTLE_MAX_DELAY = 60
+
+# HTTP status codes of requests which are worth retrying
+RETRY_STATUS_CODES = [ 429, 500, 502, 503, 504 ]
+
+# Azure Resource Manager throttles a subscription with token buckets. Reads
+# are refilled with 25 tokens per second up to 250, writes with 10 tokens per
+# second up to 200.
+READS_PER_SECOND = 25
+READ_BURST = 250
+WRITES_PER_SECOND = 10
+WRITE_BURST = 200
+
+# Rate limiters of reads and writes, None if not limited
+read_limiter = None
+write_limiter = None
+
+# Clients by credentials, so that jobs run in the same process share them
+dns_clients = {}
+
+# Azure Resource Manager batch requests
+BATCH_API_VERSION = "2020-06-01"
+BATCH_MAX_REQUESTS = 500
+BATCH_POLL_DELAY = 1
+
+# Serializers of the model classes by API version
+serializers = {}
+
+
+# The Azure SDK takes a while to import. It is imported by the functions
+# needing it, so that e.g. printing the help of a tool stays fast.
+def __getattr__(name):
+    # Tools catch errors of the SDK as azuredns.CloudError and lost
+    # connections as azuredns.ClientRequestError
+    if name == "CloudError":
+        from msrestazure.azure_exceptions import CloudError
+        return CloudError
+
+    if name == "ClientRequestError":
+        from msrest.exceptions import ClientRequestError
+        return ClientRequestError
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def add_arguments(parser):
+    parser.add_argument("--reads-per-second", type=float, default=READS_PER_SECOND, help="Average rate of read requests to Azure, 0 for no limit (default: %d)." % READS_PER_SECOND)
+    parser.add_argument("--writes-per-second", type=float, default=WRITES_PER_SECOND, help="Average rate of write requests to Azure, 0 for no limit (default: %d)." % WRITES_PER_SECOND)
+
+
+def create_limiter(limiter, rate, burst):
+    # Jobs run in the same process share the limiters, as long as the rate
+    # does not change
+    if rate <= 0:
+        return None
+
+    if limiter is not None and limiter.rate == rate:
+        return limiter
+
+    return TokenBucket(rate, max(burst, rate))
+
+
+def set_rate_limits(reads_per_second, writes_per_second):
+    global read_limiter, write_limiter
+
+    read_limiter = create_limiter(read_limiter, reads_per_second, READ_BURST)
+    write_limiter = create_limiter(write_limiter, writes_per_second, WRITE_BURST)
+
+
+def create_dns_client(args):
+    if args.reads_per_second < 0 or args.writes_per_second < 0:
+        print_error("Request rates must not be negative.")
+        sys.exit(1)
+
+    set_rate_limits(args.reads_per_second, args.writes_per_second)
+
+    if "AZURE_SUBSCRIPTION_ID" in os.environ:
+        subscription_id = os.environ['AZURE_SUBSCRIPTION_ID']
+    elif args.subscription_id is not None:
+        subscription_id = args.subscription_id
+    else:
+        print_error("AZURE_SUBSCRIPTION_ID is a required parameter.")
+        sys.exit(1)
+
+    if "AZURE_DNS_ENDPOINT" in os.environ:
+        # Talk to a local stand-in of the Azure DNS API, e.g. for benchmarks.
+        # No service principal is needed then.
+        from msrest.authentication import BasicTokenAuthentication
+
+        key = (subscription_id, os.environ['AZURE_DNS_ENDPOINT'])
+        if key not in dns_clients:
+            credentials = BasicTokenAuthentication({ "access_token": "local" })
+            dns_clients[key] = create_client(credentials, subscription_id, os.environ['AZURE_DNS_ENDPOINT'])
+
+        return dns_clients[key]
+
+    if "AZURE_CLIENT_ID" in os.environ:
+        client_id = os.environ['AZURE_CLIENT_ID']
+    elif args.client_id is not None:
+        client_id = args.client_id
+    else:
+        print_error("AZURE_CLIENT_ID is a required parameter.")
+        sys.exit(1)
+
+    key = (subscription_id, client_id)
+    if key in dns_clients:
+        return dns_clients[key]
+
+    if "AZURE_CLIENT_SECRET" in os.environ:
+        client_secret = os.environ['AZURE_CLIENT_SECRET']
+    else:
+        client_secret = getpass.getpass("client-secret: ")
+
+    if "AZURE_TENANT_ID" in os.environ:
+        tenant_id = os.environ['AZURE_TENANT_ID']
+    elif args.tenant_id is not None:
+        tenant_id = args.tenant_id
+    else:
+        print_error("AZURE_TENANT_ID is a required parameter.")
+        sys.exit(1)
+
+    from azure.common.credentials import ServicePrincipalCredentials
+
+    credentials = ServicePrincipalCredentials(client_id=client_id, secret=client_secret, tenant=tenant_id)
+    dns_clients[key] = create_client(credentials, subscription_id)
+    return dns_clients[key]
+
+
+def create_client(credentials, subscription_id, base_url=None):
+    from azure.mgmt.dns import DnsManagementClient
+
+    dns_client = DnsManagementClient(credentials, subscription_id, base_url=base_url)
+
+    # Keep connections open between requests. Each thread using the client
+    # gets its own session and connection pool.
+    dns_client.config.keep_alive = True
+
+    return dns_client
+
+
+def get_retry_delay(e, delay):
+    # Azure tells how long to wait in the Retry-After header of throttled
+    # requests. Fall back to the exponential delay if it is missing.
+    if e.response is not None:
+        retry_after = e.response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return min(int(retry_after), THROTTLE_MAX_DELAY)
+
+    return delay
+
+
+def call_with_backoff(func, *args, write=False, tokens=1, **kwargs):
+    # Azure answers with HTTP 429 if the request rate of a subscription is
+    # exceeded. Throttled requests, server errors and lost connections are
+    # retried with an exponentially growing delay.
+    from msrest.exceptions import ClientRequestError
+    from msrestazure.azure_exceptions import CloudError
+
+    limiter = write_limiter if write else read_limiter
+
+    delay = THROTTLE_INITIAL_DELAY
+    for attempt in range(THROTTLE_MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(tokens)
+
+        metrics.count("api_calls")
+        try:
+            return func(*args, **kwargs)
+        except CloudError as e:
+            if e.status_code not in RETRY_STATUS_CODES or attempt == THROTTLE_MAX_RETRIES:
+                raise
+
+            if e.status_code == 429:
+                metrics.count("throttled")
+
+            time.sleep(get_retry_delay(e, delay))
+        except ClientRequestError:
+            if attempt == THROTTLE_MAX_RETRIES:
+                raise
+
+            time.sleep(delay)
+
+        delay = min(delay * 2, THROTTLE_MAX_DELAY)
+        metrics.count("retries")
+
+
+def list_record_sets(dns_client, resource_group, zone_name):
+    # Page through all record sets of a zone. Every page is requested with
+    # backoff, so throttling does not restart the listing.
+    record_sets = dns_client.record_sets.list_all_by_dns_zone(resource_group, zone_name)
+    while True:
+        try:
+            page = call_with_backoff(record_sets.advance_page)
+        except StopIteration:
+            break
+
+        for record_set in page:
+            yield record_set
+
+
+def list_zones(dns_client, resource_group=None):
+    # List the zones of a resource group or, without a resource group, of the
+    # whole subscription.
+    if resource_group is not None:
+        zones = dns_client.zones.list_by_resource_group(resource_group)
+    else:
+        zones = dns_client.zones.list()
+
+    while True:
+        try:
+            page = call_with_backoff(zones.advance_page)
+        except StopIteration:
+            break
+
+        for zone in page:
+            yield zone
+
+
+def get_resource_group(resource):
+    # The ID of a resource looks like
+    # "/subscriptions/<id>/resourceGroups/<resource group>/providers/..."
+    # The case of "resourceGroups" is not consistent across Azure APIs.
+    parts = resource.id.split("/")
+    index = [ x.lower() for x in parts ].index("resourcegroups")
+    return parts[index + 1]
+
+
+def check_zone_names_unique(zones):
+    # The tools tell zones apart by name, e.g. to route records or to name
+    # files, so a name must not exist in more than one resource group
+    duplicates = get_duplicate_names([ zone_name for (resource_group, zone_name) in zones ])
+    if duplicates != []:
+        print_error("Zones %s exist in more than one resource group. Use --resource-group." % ", ".join(duplicates))
+        sys.exit(1)
+
+
+def create_record_set_request(dns_client, resource_group, zone_name, name, record_type, parameters):
+    # Request creating or updating a record set as part of a batch
+    from msrest import Serializer
+
+    record_sets = dns_client.record_sets
+
+    serializer = serializers.get(record_sets.api_version)
+    if serializer is None:
+        models = dns_client.models(record_sets.api_version)
+        serializer = Serializer(dict([ (k, v) for (k, v) in vars(models).items() if isinstance(v, type) ]))
+        serializers[record_sets.api_version] = serializer
+
+    url = "/subscriptions/%s/resourceGroups/%s/providers/Microsoft.Network/dnsZones/%s/%s/%s?api-version=%s" % (quote(dns_client.config.subscription_id, safe=""), quote(resource_group, safe=""), quote(zone_name, safe=""), record_type, name, record_sets.api_version)
+
+    return { "httpMethod": "PUT", "url": url, "content": serializer.body(parameters, "RecordSet") }
+
+
+def post_batch(dns_client, requests):
+    from msrestazure.azure_exceptions import CloudError
+
+    client = dns_client._client
+
+    request = client.post("/batch", { "api-version": BATCH_API_VERSION }, { "Content-Type": "application/json; charset=utf-8" }, { "requests": requests })
+    response = client.send(request, stream=False)
+
+    # Large batches are processed asynchronously. The result has to be
+    # polled from the location returned.
+    while response.status_code == 202 and "Location" in response.headers:
+        time.sleep(int(response.headers.get("Retry-After", BATCH_POLL_DELAY)))
+        metrics.count("api_calls")
+        response = client.send(client.get(response.headers["Location"]), stream=False)
+
+    if response.status_code != 200:
+        raise CloudError(response)
+
+    # A response which can not be read fails the batch like an error response
+    status_codes = [ None ] * len(requests)
+    try:
+        for x in response.json()["responses"]:
+            status_codes[int(x["name"])] = x["httpStatusCode"]
+    except (IndexError, KeyError, TypeError, ValueError):
+        raise CloudError(response, "Invalid batch response received.")
+
+    return status_codes
+
+
+def send_batch(dns_client, requests):
+    # Send requests with one Azure Resource Manager batch request. Returns
+    # the HTTP status code of every request.
+    for (index, request) in enumerate(requests):
+        request["name"] = str(index)
+
+    metrics.count("batched_requests", len(requests))
+
+    return call_with_backoff(post_batch, dns_client, requests, write=True, tokens=len(requests))
+
+
+def serialize_record_set(record_set):
+    # Record sets are cached in the form returned by the API
+    return record_set.serialize(keep_readonly=True)
+
+
+def deserialize_record_set(dns_client, data):
+    models = dns_client.models(dns_client.record_sets.api_version)
+    return models.RecordSet.deserialize(data)
+
+
+def get_record_set_type(record_set):
+    # The type of a record set is returned as e.g. "Microsoft.Network/dnszones/A"
+    return record_set.type.split("/")[-1]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import os
+import threading
+
+
+class Checkpoint(object):
+    # Journal of the record sets written so far. Every record set is appended
+    # as a line of JSON as soon as it has been written, so that a restarted
+    # run can skip it. A line cut off by a crash is ignored.
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.record_sets = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+
+                    zone_record_sets = self.record_sets.setdefault(entry["zone"], {})
+                    zone_record_sets[(entry["name"].lower(), entry["type"])] = (entry["action"], entry["lines"])
+
+        self.f = open(filename, "a")
+
+        # Terminate a line cut off by a crash, so that it does not swallow
+        # the next entry
+        if self.f.tell() > 0:
+            with open(filename, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.f.write("\n")
+
+    def get_record_sets(self, zone_name):
+        # Returns the record sets of a zone written before by (name, type)
+        return self.record_sets.get(zone_name, {})
+
+    def commit(self, action, zone_name, name, record_type, lines):
+        line = json.dumps({ "action": action, "zone": zone_name, "name": name, "type": record_type, "lines": lines })
+
+        with self.lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.filename)
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+import contextlib
+import io
+import locale
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dnstools import snapshot
+from dnstools.console import print_error
+from dnstools.records import Record
+
+
+# Size of the write buffer of CSV files. Rows are collected in the buffer
+# and written to the file in large blocks.
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Rows and the record data read from them, checked by running this module.
+# Every row has to be written again as it is.
+ROUND_TRIP_ROWS = [
+    ("www.example.com;300;A;192.0.2.1\n", "192.0.2.1"),
+    ("example.com;300;TXT;\"v=spf1 -all\"\n", "\"v=spf1 -all\""),
+    ("example.com;300;TXT;\"part1\" \"part2\"\n", "\"part1\" \"part2\""),
+    ("example.com;300;TXT;\"say \\\"hello\\\"\" \"\\\\\"\n", "\"say \\\"hello\\\"\" \"\\\\\""),
+    ("mail._domainkey.example.com;300;TXT;\"\"\"v=DKIM1; k=rsa\"\" \"\"p=MIGf\"\"\"\n", "\"v=DKIM1; k=rsa\" \"p=MIGf\""),
+    ("example.com;300;CAA;\"0 issue \"\"ca.example.net; account=1\"\"\"\n", "0 issue \"ca.example.net; account=1\""),
+    ("example.com;300;CAA;0 issue \"ca.example.net\"\n", "0 issue \"ca.example.net\""),
+]
+
+# Files are parsed in parallel in chunks of about this size. Smaller files
+# are parsed by a single process.
+PARALLEL_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+def parse_quoted_field(line, start):
+    # Return the field enclosed in double quotes at offset start of the line
+    # and the offset after it. Fields without a semicolon are never quoted,
+    # so for these (None, None) is returned and the double quotes are part of
+    # the field.
+    parts = []
+    offset = start + 1
+
+    while True:
+        quote = line.find("\"", offset)
+        if quote < 0:
+            return (None, None)
+
+        parts.append(line[offset:quote])
+        if line.startswith("\"", quote + 1):
+            parts.append("\"")
+            offset = quote + 2
+            continue
+
+        end = quote + 1
+        if end < len(line) and line[end] != ";":
+            return (None, None)
+
+        field = "".join(parts)
+        if ";" not in field:
+            return (None, None)
+
+        return (field, end)
+
+
+def split_row(line):
+    # Split a row into its fields. Rows with quoted fields are the only ones
+    # with more than three semicolons.
+    fields = line.split(";")
+    if len(fields) <= 4:
+        return fields
+
+    # Usually only the record data is quoted
+    fields = line.split(";", 3)
+    data = fields[3]
+    if "\"" not in line[:len(line) - len(data)] and len(data) > 1 and data.startswith("\"") and data.endswith("\"") and "\"" not in data[1:-1].replace("\"\"", ""):
+        fields[3] = data[1:-1].replace("\"\"", "\"")
+        return fields
+
+    fields = []
+    start = 0
+
+    while True:
+        end = None
+        if line.startswith("\"", start):
+            (field, end) = parse_quoted_field(line, start)
+
+        if end is None:
+            end = line.find(";", start)
+            if end < 0:
+                end = len(line)
+            field = line[start:end]
+
+        fields.append(field)
+
+        if end >= len(line):
+            return fields
+
+        start = end + 1
+
+
+def read_records_from_file(f):
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line == "":
+            continue
+
+        row = split_row(line)
+        if len(row) != 4 or not row[1].isdigit():
+            print_error("Invalid CSV provided!")
+            sys.exit(1)
+
+        yield Record(row[0], int(row[1]), row[2], row[3])
+
+
+def get_chunks(mm, size, count):
+    # Split a file into count chunks of about the same size. Every row is one
+    # line, so chunks end with a line break.
+    boundaries = [ 0 ]
+
+    for index in range(1, count):
+        target = size * index // count
+        offset = mm.find(b"\n", max(target, boundaries[-1])) + 1
+        if offset == 0 or offset >= size:
+            break
+
+        boundaries.append(offset)
+
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_chunk(csv_filename, start, end):
+    # Parse and validate a chunk of a CSV file in a worker process. Rows are
+    # returned as tuples, as these are passed back to the parent process much
+    # faster than records.
+    with open(csv_filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode(locale.getpreferredencoding(False))
+
+    rows = []
+    for line in text.split("\n"):
+        line = line.rstrip("\r")
+        if line == "":
+            continue
+
+        row = split_row(line)
+        if len(row) != 4 or not row[1].isdigit():
+            raise ValueError("Invalid row: %s" % ";".join(row))
+
+        rows.append((row[0], int(row[1]), row[2], row[3]))
+
+    return rows
+
+
+def read_records_parallel(csv_filename, workers):
+    # Parse large files in chunks by a pool of processes. The records are
+    # yielded in the order of the file. At most two chunks per worker are
+    # parsed ahead, so memory use does not grow with the file.
+    with open(csv_filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            chunks = get_chunks(mm, size, max(workers, size // PARALLEL_CHUNK_SIZE))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = collections.deque()
+        chunks = iter(chunks)
+
+        while True:
+            for (start, end) in chunks:
+                futures.append(executor.submit(parse_chunk, csv_filename, start, end))
+                if len(futures) >= workers * 2:
+                    break
+
+            if len(futures) == 0:
+                break
+
+            try:
+                rows = futures.popleft().result()
+            except ValueError:
+                print_error("Invalid CSV provided!")
+                sys.exit(1)
+
+            for row in rows:
+                yield Record(row[0], row[1], row[2], row[3])
+
+
+def read_records(csv_filename, workers=1):
+    # Stream the CSV file row by row. Files larger than a chunk are parsed by
+    # several processes if workers is greater than 1. Snapshots are read
+    # instead if the file is one.
+    if snapshot.is_snapshot(csv_filename):
+        yield from snapshot.read_records(csv_filename)
+        return
+
+    if workers > 1 and os.path.getsize(csv_filename) > PARALLEL_CHUNK_SIZE:
+        for record in read_records_parallel(csv_filename, workers):
+            yield record
+        return
+
+    with open(csv_filename, "r", newline="") as f:
+        for record in read_records_from_file(f):
+            yield record
+
+
+def read_record_groups(csv_filename, workers=1):
+    # Yield the records of consecutive rows with the same DNS name as one
+    # group.
+    dns_name = None
+    records = []
+
+    for record in read_records(csv_filename, workers):
+        if record.name != dns_name:
+            if records != []:
+                yield (dns_name, records)
+
+            dns_name = record.name
+            records = []
+
+        records.append(record)
+
+    if records != []:
+        yield (dns_name, records)
+
+
+def format_field(value):
+    # Fields are written as they are, unless they contain a semicolon. These
+    # are enclosed in double quotes, with double quotes in them doubled. Line
+    # breaks are written as escapes of zone files, so every row is one line.
+    if "\n" in value or "\r" in value:
+        value = value.replace("\r", "\\013").replace("\n", "\\010")
+
+    if ";" in value:
+        return "\"%s\"" % value.replace("\"", "\"\"")
+
+    return value
+
+
+def format_row(name, ttl, record_type, data):
+    row = "%s;%s;%s;%s\n" % (name, ttl, record_type, data)
+    if row.count(";") == 3 and row.count("\n") == 1 and "\r" not in row:
+        return row
+
+    return "%s;%s;%s;%s\n" % (format_field(name), ttl, format_field(record_type), format_field(data))
+
+
+def write_records_to_file(f, records):
+    f.writelines(( format_row(record.name, record.ttl, record.type, record.data) for record in records ))
+
+
+def write_records(csv_filename, records):
+    # Files named *.dnssnap are written as snapshots
+    if snapshot.is_snapshot_filename(csv_filename):
+        snapshot.write_records(csv_filename, records)
+        return
+
+    with open(csv_filename, "w", newline="", buffering=WRITE_BUFFER_SIZE) as f:
+        write_records_to_file(f, records)
+
+
+@contextlib.contextmanager
+def replace_on_success(csv_filename):
+    # Yield the name of a temporary file next to the given one, which
+    # replaces it once the block completes. A failed run neither leaves a
+    # partial file behind nor removes the file of an earlier run. The name
+    # keeps the extension, so snapshots are still detected.
+    (directory, basename) = os.path.split(csv_filename)
+    temp_csv_filename = os.path.join(directory, ".%d.%d.%s" % (os.getpid(), threading.get_ident(), basename))
+
+    try:
+        yield temp_csv_filename
+    except BaseException:
+        if os.path.exists(temp_csv_filename):
+            os.remove(temp_csv_filename)
+        raise
+
+    os.replace(temp_csv_filename, csv_filename)
+
+
+def concatenate_files(csv_filenames, csv_filename):
+    # Write the records of several CSV files to one file in the given order.
+    # CSV files are copied as they are.
+    if snapshot.is_snapshot_filename(csv_filename):
+        write_records(csv_filename, ( record for x in csv_filenames for record in read_records(x) ))
+        return
+
+    with open(csv_filename, "w") as f:
+        for x in csv_filenames:
+            with open(x, "r") as zone_f:
+                shutil.copyfileobj(zone_f, f)
+
+
+def write_zone_files(zones, zone_names, csv_filename, output_dir, workers, write_zone):
+    # Call write_zone(zone, zone_csv_filename) for every zone in a pool of
+    # threads. It returns a result and an error, which is None if the zone
+    # was written. With an output directory every zone is written to a file
+    # named after it. Otherwise every zone is written to a temporary file
+    # first, and the files of the zones written are concatenated in the
+    # order of the zones. Returns the results and errors in that order.
+    temp_dir = None
+    if output_dir is None:
+        temp_dir = tempfile.mkdtemp()
+
+    try:
+        zone_csv_filenames = []
+        for (index, zone_name) in enumerate(zone_names):
+            if output_dir is not None:
+                zone_csv_filenames.append(os.path.join(output_dir, "%s.csv" % zone_name))
+            else:
+                zone_csv_filenames.append(os.path.join(temp_dir, "%d.csv" % index))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [ executor.submit(write_zone, zone, zone_csv_filename) for (zone, zone_csv_filename) in zip(zones, zone_csv_filenames) ]
+            results = [ future.result() for future in futures ]
+
+        if output_dir is None:
+            concatenate_files([ x for (x, (result, error)) in zip(zone_csv_filenames, results) if error is None ], csv_filename)
+
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    return results
+
+
+def check_round_trip():
+    for (row, data) in ROUND_TRIP_ROWS:
+        records = list(read_records_from_file(io.StringIO(row)))
+        if records[0].data != data:
+            print_error("Row %s read as %s." % (row.strip(), records[0].data))
+            sys.exit(1)
+
+        f = io.StringIO()
+        write_records_to_file(f, records)
+        if f.getvalue() != row:
+            print_error("Row %s written as %s." % (row.strip(), f.getvalue().strip()))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    check_round_trip()
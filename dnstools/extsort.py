@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import heapq
+import tempfile
+
+from dnstools.csvcodec import read_records_from_file, write_records_to_file
+
+
+DEFAULT_CHUNK_SIZE = 500000
+
+
+def sort_records(records, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    # External merge sort: Records are sorted in chunks of chunk_size records.
+    # Each sorted chunk is written to a temporary file and the files are
+    # merged at the end, so at most one chunk is held in memory. The sort is
+    # stable, records with equal keys keep the order in which they arrived.
+    chunk_files = []
+    chunk = []
+
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                chunk_files.append(write_chunk(chunk, key))
+                chunk = []
+
+        chunk.sort(key=key)
+
+        if chunk_files == []:
+            for record in chunk:
+                yield record
+            return
+
+        if chunk != []:
+            chunk_files.append(write_chunk(chunk, key))
+            chunk = []
+
+        chunks = [ read_records_from_file(f) for f in chunk_files ]
+        for record in heapq.merge(*chunks, key=key):
+            yield record
+
+    finally:
+        for f in chunk_files:
+            f.close()
+
+
+def write_chunk(chunk, key):
+    chunk.sort(key=key)
+
+    f = tempfile.TemporaryFile("w+", newline="")
+    write_records_to_file(f, chunk)
+    f.seek(0)
+
+    return f
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import atexit
+import contextlib
+import json
+import sys
+import threading
+import time
+
+
+# Minimum number of seconds between two updates of the progress line
+PROGRESS_INTERVAL = 1
+
+# Counters shown in the progress line
+PROGRESS_COUNTERS = [ "api_calls", "retries", "throttled", "errors" ]
+
+lock = threading.Lock()
+start_time = time.time()
+counters = {}
+phases = {}
+
+progress_enabled = False
+progress_time = 0
+progress_shown = False
+
+metrics_filename = None
+finish_registered = False
+
+
+def add_arguments(parser):
+    parser.add_argument("--progress", action="store_true", help="Show a progress line with the number of records processed per second.")
+    parser.add_argument("--metrics-file", type=str, help="File to write counters and times of the run to as JSON at exit.")
+
+
+def setup(args):
+    # Called once per run of a tool. Several tools may run in the same
+    # process one after the other, each with metrics of its own.
+    global progress_enabled, metrics_filename, finish_registered
+
+    reset()
+    progress_enabled = args.progress
+    metrics_filename = args.metrics_file
+
+    if not finish_registered:
+        atexit.register(finish)
+        finish_registered = True
+
+
+def reset():
+    global start_time
+
+    with lock:
+        start_time = time.time()
+        counters.clear()
+        phases.clear()
+
+
+def finish():
+    # End the run of a tool: finish the progress line and write the metrics
+    global metrics_filename
+
+    finish_progress()
+
+    if metrics_filename is not None:
+        write_metrics(metrics_filename)
+        metrics_filename = None
+
+
+def count(name, value=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+    if progress_enabled and name == "records":
+        show_progress()
+
+
+@contextlib.contextmanager
+def phase(name):
+    # Measure the time spent in a phase of the run. Phases entered more than
+    # once, e.g. by several threads, add up.
+    start = time.time()
+    try:
+        yield
+    finally:
+        with lock:
+            phases[name] = phases.get(name, 0) + time.time() - start
+
+
+def get_metrics():
+    with lock:
+        seconds = time.time() - start_time
+        records = counters.get("records", 0)
+        return { "seconds": seconds, "records_per_second": records / seconds if seconds > 0 else 0, "counters": dict(counters), "phases": dict(phases) }
+
+
+def show_progress(force=False):
+    global progress_time, progress_shown
+
+    now = time.time()
+    with lock:
+        if not force and now - progress_time < PROGRESS_INTERVAL:
+            return
+
+        progress_time = now
+        progress_shown = True
+
+    metrics = get_metrics()
+    line = "%d records, %.0f records/s" % (metrics["counters"].get("records", 0), metrics["records_per_second"])
+    for name in PROGRESS_COUNTERS:
+        if name in metrics["counters"]:
+            line += ", %d %s" % (metrics["counters"][name], name.replace("_", " "))
+
+    sys.stderr.write("\r%s " % line)
+    sys.stderr.flush()
+
+
+def finish_progress():
+    # End the progress line, e.g. before the results are printed
+    global progress_shown
+
+    if progress_shown:
+        show_progress(True)
+        sys.stderr.write("\n")
+        progress_shown = False
+
+
+def write_metrics(metrics_filename):
+    with open(metrics_filename, "w") as f:
+        json.dump(get_metrics(), f, indent=2, sort_keys=True)
+        f.write("\n")
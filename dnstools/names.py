@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import collections
+
+
+def normalize_zone_name(zone_name):
+    # Make sure that zone name does not start with "." nor ends with "."
+    return zone_name.strip(".")
+
+
+def get_absolute_name(name, zone_name):
+    if name == "@":
+        return zone_name
+
+    return "%s.%s" % (name, zone_name)
+
+
+def get_relative_name(dns_name, zone_name):
+    if dns_name == zone_name:
+        return "@"
+
+    if dns_name.endswith("." + zone_name):
+        return dns_name[:-len(zone_name) - 1]
+
+    return dns_name
+
+
+def find_zone(dns_name, zone_names):
+    # Return the most specific zone of the set zone_names a name belongs to.
+    # The name itself and then its parent names are looked up, so the cost
+    # depends on the number of labels only and not on the number of zones.
+    name = dns_name
+    while name not in zone_names:
+        index = name.find(".")
+        if index < 0:
+            return None
+
+        name = name[index + 1:]
+
+    return name
+
+
+def qualify_name(ref_name, zone_name):
+    # Names referenced by records which are not terminated with a dot are
+    # relative to the zone.
+    if ref_name.endswith("."):
+        return ref_name
+
+    return "%s.%s." % (ref_name, zone_name)
+
+
+def get_duplicate_names(names):
+    # Return the names occurring more than once, sorted
+    counts = collections.Counter(names)
+    return sorted([ x for x in counts if counts[x] > 1 ])
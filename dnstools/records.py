@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+
+
+class Record(object):
+    # A single DNS record. Instances are kept for every row of a zone, hence
+    # they use __slots__, and names and types are interned as they repeat
+    # a lot.
+    __slots__ = ("name", "ttl", "type", "data")
+
+    def __init__(self, name, ttl, record_type, data):
+        self.name = sys.intern(name)
+        self.ttl = ttl
+        self.type = sys.intern(record_type)
+        self.data = data
+
+    def __repr__(self):
+        return "Record(%r, %r, %r, %r)" % (self.name, self.ttl, self.type, self.data)
+
+
+class RecordSet(object):
+    # All records of a DNS name with the same type. The data of the records
+    # is kept as a list of strings.
+    __slots__ = ("name", "type", "ttl", "data")
+
+    def __init__(self, name, record_type, ttl, data=None):
+        self.name = sys.intern(name)
+        self.type = sys.intern(record_type)
+        self.ttl = ttl
+        self.data = data if data is not None else []
+
+    def records(self):
+        for data in self.data:
+            yield Record(self.name, self.ttl, self.type, data)
+
+    def __repr__(self):
+        return "RecordSet(%r, %r, %r, %r)" % (self.name, self.type, self.ttl, self.data)
+
+
+def group_record_sets(records):
+    # Group records into record sets, keeping the order in which names and
+    # types occur first. The records of a record set must have the same TTL,
+    # see validate_zone_dicts.
+    record_sets = {}
+    for record in records:
+        key = (record.name, record.type)
+        if key in record_sets:
+            record_sets[key].data.append(record.data)
+        else:
+            record_sets[key] = RecordSet(record.name, record.type, record.ttl, [ record.data ])
+
+    return list(record_sets.values())
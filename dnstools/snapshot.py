@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+from dnstools.console import print_error
+from dnstools.records import Record
+
+
+# Files with this extension are written as snapshots instead of CSV files
+SNAPSHOT_EXTENSION = ".dnssnap"
+
+SNAPSHOT_MAGIC = b"DNSSNAP\x00"
+SNAPSHOT_VERSION = 1
+
+# Magic, version, flags, number of records, number of strings, size of the
+# string table and size of the record data in bytes
+HEADER = struct.Struct("<8sIIQQQQ")
+
+# Set in the flags if the record data is ASCII only
+FLAG_ASCII = 1
+
+# Set in the flags if the record data exceeds 4 GB and the data offsets are
+# stored with 64 bit
+FLAG_LARGE_DATA = 2
+
+# Set in the flags if the string table is ASCII only
+FLAG_ASCII_STRINGS = 4
+
+# Number of records whose data is decoded at once while reading
+READ_BLOCK_SIZE = 65536
+
+# Sections are aligned to this number of bytes, so that columns can be
+# used directly from the memory-mapped file
+ALIGNMENT = 8
+
+# Largest TTL of a DNS record and largest offset of small data (unsigned
+# 32 bit)
+MAX_TTL = 2 ** 32 - 1
+MAX_OFFSET = 2 ** 32 - 1
+
+
+# A snapshot holds the records of one or more zones in columns:
+#
+#   header
+#   string offsets  uint64 * (number of strings + 1)
+#   name            uint32 * number of records, index into the strings
+#   type            uint32 * number of records, index into the strings
+#   TTL             uint32 * number of records
+#   data offsets    uint32 * (number of records + 1), uint64 for more than
+#                   4 GB of data
+#   strings         UTF-8
+#   data            UTF-8
+#
+# Names and types are interned in the string table, so every distinct name
+# is stored only once. All numbers are little-endian.
+
+
+def is_snapshot_filename(filename):
+    return filename.endswith(SNAPSHOT_EXTENSION)
+
+
+def is_snapshot(filename):
+    # Snapshots are recognized by their content, regardless of the file name
+    with open(filename, "rb") as f:
+        return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def get_padding(size):
+    return b"\x00" * (-size % ALIGNMENT)
+
+
+def write_column(f, column):
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+
+    data = column.tobytes()
+    f.write(data)
+    f.write(get_padding(len(data)))
+
+
+def write_records(filename, records):
+    strings = {}
+    string_offsets = array("Q", [ 0 ])
+    string_data = bytearray()
+    names = array("I")
+    types = array("I")
+    ttls = array("I")
+    data_offsets = array("Q", [ 0 ])
+    data = bytearray()
+
+    for record in records:
+        for (value, column) in [ (record.name, names), (record.type, types) ]:
+            index = strings.get(value)
+            if index is None:
+                index = len(strings)
+                strings[value] = index
+                string_data += value.encode("utf-8")
+                string_offsets.append(len(string_data))
+
+            column.append(index)
+
+        if record.ttl < 0 or record.ttl > MAX_TTL:
+            print_error("TTL %d of %s is out of range." % (record.ttl, record.name))
+            sys.exit(1)
+
+        ttls.append(record.ttl)
+        data += record.data.encode("utf-8")
+        data_offsets.append(len(data))
+
+    flags = 0
+    if data.isascii():
+        flags |= FLAG_ASCII
+
+    if string_data.isascii():
+        flags |= FLAG_ASCII_STRINGS
+
+    if len(data) > MAX_OFFSET:
+        flags |= FLAG_LARGE_DATA
+    else:
+        data_offsets = array("I", data_offsets)
+
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, len(ttls), len(strings), len(string_data), len(data)))
+        for column in [ string_offsets, names, types, ttls, data_offsets ]:
+            write_column(f, column)
+
+        f.write(string_data)
+        f.write(get_padding(len(string_data)))
+        f.write(data)
+
+
+def decode_strings(data, offsets, ascii):
+    # ASCII-only strings are decoded at once and sliced, which is much
+    # faster than decoding every string
+    if ascii:
+        base = offsets[0]
+        text = str(data[base:offsets[-1]], "ascii")
+        return [ text[offsets[i] - base:offsets[i + 1] - base] for i in range(len(offsets) - 1) ]
+
+    return [ str(data[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1) ]
+
+
+class Snapshot(object):
+    # Read access to a snapshot file. The file is memory-mapped and the
+    # columns are used in place, so opening a snapshot costs no parsing.
+    # Only the string table is decoded up front.
+
+    def __init__(self, filename):
+        self.f = open(filename, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+
+        try:
+            (magic, version, self.flags, self.count, string_count, string_size, data_size) = HEADER.unpack_from(self.mm, 0)
+        except struct.error:
+            magic = None
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError("%s is not a snapshot of version %d." % (filename, SNAPSHOT_VERSION))
+
+        self.offset = HEADER.size
+        string_offsets = self.get_column("Q", string_count + 1)
+        self.names = self.get_column("I", self.count)
+        self.types = self.get_column("I", self.count)
+        self.ttls = self.get_column("I", self.count)
+        self.data_offsets = self.get_column("Q" if self.flags & FLAG_LARGE_DATA else "I", self.count + 1)
+        string_data = self.get_section(string_size)
+        self.data = self.get_section(data_size)
+
+        self.strings = decode_strings(string_data, string_offsets.tolist(), self.flags & FLAG_ASCII_STRINGS)
+
+    def get_section(self, size):
+        if self.offset + size > len(self.mm):
+            self.close()
+            raise ValueError("Snapshot is truncated.")
+
+        section = self.view[self.offset:self.offset + size]
+        self.offset += size + len(get_padding(size))
+        return section
+
+    def get_column(self, typecode, count):
+        section = self.get_section(count * array(typecode).itemsize)
+
+        if sys.byteorder != "little":
+            column = array(typecode, section.tobytes())
+            column.byteswap()
+            return column
+
+        return section.cast(typecode)
+
+    def __len__(self):
+        return self.count
+
+    def get_data(self, start, end):
+        # Returns the data of the records start to end
+        return decode_strings(self.data, self.data_offsets[start:end + 1].tolist(), self.flags & FLAG_ASCII)
+
+    def records(self):
+        get_string = self.strings.__getitem__
+
+        for start in range(0, self.count, READ_BLOCK_SIZE):
+            end = min(start + READ_BLOCK_SIZE, self.count)
+            names = map(get_string, self.names[start:end].tolist())
+            types = map(get_string, self.types[start:end].tolist())
+
+            yield from map(Record, names, self.ttls[start:end].tolist(), types, self.get_data(start, end))
+
+    def close(self):
+        # The views have to be released before the file can be unmapped
+        for name in [ "names", "types", "ttls", "data_offsets", "data", "view" ]:
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+
+        self.mm.close()
+        self.f.close()
+
+
+def read_records(filename):
+    try:
+        snapshot = Snapshot(filename)
+    except ValueError as e:
+        print_error("Invalid snapshot provided: %s" % e)
+        sys.exit(1)
+
+    try:
+        yield from snapshot.records()
+    finally:
+        snapshot.close()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import itertools
+import socket
+
+from dnstools.names import qualify_name
+
+
+# Types of records which may exist next to a CNAME record, e.g. in zones
+# signed with DNSSEC
+CNAME_COMPATIBLE_TYPES = [ "NSEC", "RRSIG" ]
+
+
+def is_ipv4_address(value):
+    try:
+        socket.inet_pton(socket.AF_INET, value)
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+def is_ipv6_address(value):
+    try:
+        socket.inet_pton(socket.AF_INET6, value)
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+
+ADDRESS_CHECKS = {
+    "A": ("IPv4", is_ipv4_address),
+    "AAAA": ("IPv6", is_ipv6_address),
+}
+
+
+def get_unterminated_alias_warning(record, dns_name, zone_name):
+    # Azure DNS seems to not support relative names
+    return "Name %s referenced by CNAME record %s is not terminated with a dot (\".\"). This might cause unexpected behavior in Azure DNS. Hence, zone name was added to the name: %s" % (record.data, dns_name, qualify_name(record.data, zone_name))
+
+
+def validate_name(dns_name, records, record_types_supported):
+    # Check the record sets of a name with more than one record
+    errors = []
+
+    record_sets = {}
+    for record in records:
+        record_sets.setdefault(record.type, []).append(record)
+
+    for record_type in sorted(record_sets):
+        if record_type not in record_types_supported:
+            continue
+
+        ttls = sorted(set([ x.ttl for x in record_sets[record_type] ]))
+        if len(ttls) > 1:
+            errors.append("Inconsistent TTLs %s in %s record set for name %s. All records of a record set must have the same TTL." % (", ".join([ "%d" % x for x in ttls ]), record_type, dns_name))
+
+    if "CNAME" in record_sets and "CNAME" in record_types_supported:
+        if len(record_sets["CNAME"]) > 1:
+            errors.append("More than one alias in CNAME record set for name %s. This is not valid!" % dns_name)
+
+        other_types = [ x for x in sorted(record_sets) if x != "CNAME" and x not in CNAME_COMPATIBLE_TYPES ]
+        if other_types != []:
+            errors.append("CNAME record set for name %s next to records of type %s. A name with an alias must not have other data." % (dns_name, ", ".join(other_types)))
+
+    return errors
+
+
+def validate_zone_dicts(zone_dicts, record_types_supported):
+    # Check the records of all zones before anything is written, so that an
+    # invalid CSV file is rejected as a whole. Returns warnings and errors.
+    # The checks run in batches over all records of a zone. Only names whose
+    # records may conflict are checked one by one.
+    warnings = []
+    errors = []
+    record_types = set([])
+    invalid_addresses = {}
+
+    for zone_name in sorted(zone_dicts):
+        zone_dict = zone_dicts[zone_name]
+
+        record_types.update([ record.type for records in zone_dict.values() for record in records ])
+
+        # Names with records of a single type and TTL other than CNAME are
+        # valid
+        for (dns_name, records) in zone_dict.items():
+            if len(records) > 1 and (records[0].type == "CNAME" or len(set([ (x.type, x.ttl) for x in records ])) > 1):
+                errors.extend(validate_name(dns_name, records, record_types_supported))
+
+        if "CNAME" in record_types_supported:
+            warnings.extend([ get_unterminated_alias_warning(record, dns_name, zone_name) for (dns_name, records) in zone_dict.items() for record in records if record.type == "CNAME" and not record.data.endswith(".") ])
+
+        # Every distinct address is checked once
+        for record_type in ADDRESS_CHECKS:
+            if record_type in record_types_supported:
+                addresses = set([ record.data for records in zone_dict.values() for record in records if record.type == record_type ])
+                invalid_addresses[record_type] = set(itertools.filterfalse(ADDRESS_CHECKS[record_type][1], addresses))
+
+        # Only if there are invalid addresses the names using them are
+        # searched
+        if not any(invalid_addresses.values()):
+            continue
+
+        for (dns_name, records) in zone_dict.items():
+            for record in records:
+                if record.data in invalid_addresses.get(record.type, ()):
+                    errors.append("Invalid %s address %s in %s record for name %s." % (ADDRESS_CHECKS[record.type][0], record.data, record.type, dns_name))
+
+    for record_type in sorted(record_types):
+        if record_type not in record_types_supported:
+            warnings.append("Record(s) of type %s in CSV file which is currently not supported by the tool. Please handle records manually." % record_type)
+
+    return (warnings, errors)
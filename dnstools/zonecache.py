@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+MIT License
+
+Copyright (c) 2020 devsecurity.io <dns-tools@devsecurity.io>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from dnstools import metrics
+from dnstools.console import print_error
+
+
+# Entries older than this are downloaded again, even if the zone looks
+# unchanged
+CACHE_MAX_AGE = 3600
+
+# Size of the cache file above which the least recently used zones are evicted
+CACHE_MAX_SIZE = 1024
+
+
+def add_arguments(parser):
+    parser.add_argument("--cache-file", type=str, help="SQLite file caching the record sets of the zones. Zones whose ETag and number of record sets are unchanged are served from the cache instead of being listed again. Edited record sets are not noticed until the entry is older than --cache-max-age.")
+    parser.add_argument("--cache-max-age", type=int, default=CACHE_MAX_AGE, help="Together with --cache-file: number of seconds a cached zone is used for (default: %d)." % CACHE_MAX_AGE)
+    parser.add_argument("--cache-max-size", type=int, default=CACHE_MAX_SIZE, help="Together with --cache-file: size of the cached record sets in MB above which the least recently used zones are evicted (default: %d)." % CACHE_MAX_SIZE)
+    parser.add_argument("--cache-invalidate", action="store_true", help="Together with --cache-file: drop the cached record sets of the zones before they are used.")
+
+
+def open_cache(args):
+    # Returns None without --cache-file
+    if args.cache_file is None:
+        if args.cache_invalidate:
+            print_error("--cache-invalidate can only be used together with --cache-file.")
+            sys.exit(1)
+
+        return None
+
+    if args.cache_max_age < 0 or args.cache_max_size < 0:
+        print_error("--cache-max-age and --cache-max-size must not be negative.")
+        sys.exit(1)
+
+    try:
+        return ZoneCache(args.cache_file, args.cache_max_age, args.cache_max_size * 1024 * 1024, args.cache_invalidate)
+    except sqlite3.Error as e:
+        print_error("Cache file %s cannot be opened: %s" % (args.cache_file, e))
+        sys.exit(1)
+
+
+class ZoneCache(object):
+    # Last seen record sets of Azure DNS zones, one row per zone. The record
+    # sets are stored as compressed JSON as returned by the API, together
+    # with the ETag and the number of record sets of the zone at the time
+    # they were listed. A zone is served from the cache as long as both are
+    # unchanged and the entry is not older than max_age seconds.
+
+    def __init__(self, filename, max_age, max_size, invalidate=False):
+        self.max_age = max_age
+        self.max_size = max_size
+        self.invalidate_all = invalidate
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS zones (resource_group TEXT, zone_name TEXT, etag TEXT, record_set_count INTEGER, fetched REAL, used REAL, data BLOB, PRIMARY KEY (resource_group, zone_name))")
+        self.connection.commit()
+
+    def get(self, resource_group, zone_name, etag, record_set_count):
+        # Returns the cached record sets of the zone or None
+        key = (resource_group.lower(), zone_name.lower())
+
+        with self.lock:
+            if self.invalidate_all:
+                self.connection.execute("DELETE FROM zones WHERE resource_group = ? AND zone_name = ?", key)
+                self.connection.commit()
+
+            row = self.connection.execute("SELECT etag, record_set_count, fetched, data FROM zones WHERE resource_group = ? AND zone_name = ?", key).fetchone()
+
+            if row is None or row[0] != etag or row[1] != record_set_count or time.time() - row[2] > self.max_age:
+                metrics.count("cache_misses")
+                return None
+
+            self.connection.execute("UPDATE zones SET used = ? WHERE resource_group = ? AND zone_name = ?", (time.time(),) + key)
+            self.connection.commit()
+
+        metrics.count("cache_hits")
+        return json.loads(zlib.decompress(row[3]).decode("utf-8"))
+
+    def put(self, resource_group, zone_name, etag, record_set_count, record_sets):
+        key = (resource_group.lower(), zone_name.lower())
+        data = zlib.compress(json.dumps(record_sets).encode("utf-8"))
+        now = time.time()
+
+        with self.lock:
+            if len(data) > self.max_size:
+                self.connection.execute("DELETE FROM zones WHERE resource_group = ? AND zone_name = ?", key)
+            else:
+                self.connection.execute("INSERT OR REPLACE INTO zones VALUES (?, ?, ?, ?, ?, ?, ?)", key + (etag, record_set_count, now, now, data))
+                self.evict()
+
+            self.connection.commit()
+
+    def evict(self):
+        # Called with the lock held. Drops the least recently used zones
+        # until the cache fits into max_size again.
+        size = self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM zones").fetchone()[0]
+        if size <= self.max_size:
+            return
+
+        rows = self.connection.execute("SELECT resource_group, zone_name, LENGTH(data) FROM zones ORDER BY used").fetchall()
+        for (resource_group, zone_name, length) in rows:
+            if size <= self.max_size:
+                break
+
+            self.connection.execute("DELETE FROM zones WHERE resource_group = ? AND zone_name = ?", (resource_group, zone_name))
+            metrics.count("cache_evictions")
+            size -= length
+
+    def invalidate(self, resource_group, zone_name):
+        # Called after writing to a zone, as the cached record sets are
+        # outdated then
+        with self.lock:
+            self.connection.execute("DELETE FROM zones WHERE resource_group = ? AND zone_name = ?", (resource_group.lower(), zone_name.lower()))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()